@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import platform
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from datetime import datetime
+from matplotlib.animation import FuncAnimation
+from .pso_algo import PSO
+from .surrogate import RBFSurrogate
+from .bot_sim import ETC_PSO_Member
+from .pygame_handler import GameHandler
+from .main import PLOT_TRAINING
+from .utilities import animate, get_path, get_coord, etc_pso_params, game_params, pso_params
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Benchmarks for the slow parts of RUN
+
+'''
+
+def legacy_update(anim, frame):
+    '''
+    Previous animate.update: every frame plots
+    the whole history of every particle again
+
+    '''
+
+    for index in range(anim.num_lines):
+        curr_pt = anim.data[index, :frame]
+        if anim.oneD:
+            anim.ax.plot(curr_pt)
+        else:
+            anim.ax.plot(curr_pt[:, 0], curr_pt[:, 1])
+    return []
+
+
+def time_gif(data, folder, legacy=False):
+    '''
+    Seconds taken to build & save the GIF of the
+    evolution of data (num_bots, num_steps, 2)
+    the way RUN does it
+
+    '''
+
+    fig, ax = plt.subplots(1, 1, figsize=(7, 7))
+    start = time.perf_counter()
+    anim = animate(ax, "", "", "", data, data[0, -1], data[0, 0])
+    func = (lambda frame: legacy_update(anim, frame)) if legacy else anim.update
+    final = FuncAnimation(fig=fig, func=func, init_func=anim.init,
+                          frames=range(1, data.shape[1]), interval=100, blit=not legacy)
+    final.save(os.path.join(folder, "benchmark.gif"), writer="pillow")
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+def animation_benchmark(folder, num_steps_list=(10, 25, 50), num_bots_list=(10, 25, 50), legacy=True, seed=0):
+    '''
+    GIF generation time against num_steps & num_bots
+    on random walks of the weights; legacy also
+    times the previous animate.update for comparison
+
+    '''
+
+    matplotlib.use("Agg")
+    rng = np.random.default_rng(seed)
+    results = []
+    print(f"{'num_steps':>10}{'num_bots':>10}{'time (s)':>12}{'legacy (s)':>12}")
+    for num_steps in num_steps_list:
+        for num_bots in num_bots_list:
+            data = np.cumsum(rng.standard_normal((num_bots, num_steps, 2)), axis=1)
+            result = {"num_steps": num_steps, "num_bots": num_bots,
+                      "time": time_gif(data, folder)}
+            if legacy:
+                result["legacy_time"] = time_gif(data, folder, legacy=True)
+            results.append(result)
+            print(f"{num_steps:>10}{num_bots:>10}{result['time']:>12.2f}{result.get('legacy_time', np.nan):>12.2f}")
+    return results
+
+
+def update_mode_benchmark(num_bots=20, num_iter=20, executor="process", num_workers=None, seed=0, levels=(0.9, 0.99, 1.)):
+    '''
+    Wall-clock convergence of the "sync" & "async"
+    update modes on the same budget of evaluations
+    (num_bots x num_iter), seed & fixed path: the
+    time each mode takes to first reach the given
+    fractions of the improvement of the best score
+    made by the sync run
+
+    '''
+
+    path = get_path(random_flag=0)
+    results = {}
+    for update_mode in ("sync", "async"):
+        pso = PSO(num_bots, executor=executor, num_workers=num_workers, seed=seed,
+                  update_mode=update_mode, **dict(etc_pso_params, path=path))
+        output = pso.train(num_iter, pso_params["learning_rate"])
+        results[update_mode] = {"best_scores": np.array(output["best_scores_history"]),
+                                "times": np.array(output["time_history"])}
+
+    first = results["sync"]["best_scores"][0]
+    final = results["sync"]["best_scores"][-1]
+    print(f"{'mode':>8}{'total (s)':>12}{'final best':>14}" + "".join(f"{f't({level:g})':>10}" for level in levels))
+    for update_mode, result in results.items():
+        best_scores, times = result["best_scores"], result["times"]
+        result["time_to_level"] = {}
+        for level in levels:
+            reached = best_scores >= first + level*(final - first)
+            result["time_to_level"][level] = times[np.argmax(reached)] if reached.any() else np.nan
+        print(f"{update_mode:>8}{times[-1]:>12.2f}{best_scores[-1]:>14.3f}"
+              + "".join(f"{result['time_to_level'][level]:>10.2f}" for level in levels))
+    return results
+
+
+def surrogate_benchmark(num_bots=20, num_iter=30, seeds=range(5), eval_mode="batch", **surrogate_params):
+    '''
+    Real evaluations saved by the surrogate: for
+    every seed a plain run and a surrogate-assisted
+    run on the same path; reports the real evaluations
+    each needed to first reach the final best score of
+    the plain run, and the best score of the plain run
+    after as many evaluations as the surrogate run used
+    
+    '''
+    
+    path = get_path(random_flag=0)
+    params = dict(etc_pso_params, path=path)
+    surrogate_params = dict({"min_points": 2*num_bots}, **surrogate_params)
+    results = []
+    print(f"{'seed':>6}{'plain best':>12}{'evals':>8}{'surr. best':>12}{'evals':>8}{'to plain best':>15}{'plain @ evals':>15}")
+    for seed in seeds:
+        plain = PSO(num_bots, eval_mode=eval_mode, seed=seed, **params).train(num_iter, pso_params["learning_rate"], verbose=False)
+        assisted = PSO(num_bots, eval_mode=eval_mode, seed=seed, surrogate=RBFSurrogate(params["range_var"], **surrogate_params),
+                       **params).train(num_iter, pso_params["learning_rate"], verbose=False)
+        
+        plain_evals = num_bots*np.arange(1, num_iter + 1)
+        real_evals = np.array(assisted["surrogate_stats"]["real_evals"])
+        target = plain["best_scores_history"][-1]
+        reached = assisted["best_scores_history"] >= target
+        result = {"seed": seed,
+                  "plain_best": target,
+                  "plain_evals": int(plain_evals[np.argmax(plain["best_scores_history"] >= target)]),
+                  "surrogate_best": assisted["best_scores_history"][-1],
+                  "surrogate_evals": int(real_evals[-1]),
+                  "evals_to_plain_best": int(real_evals[np.argmax(reached)]) if reached.any() else None,
+                  "plain_best_at_evals": plain["best_scores_history"][np.searchsorted(plain_evals, real_evals[-1], side="right") - 1]}
+        results.append(result)
+        print(f"{seed:>6}{result['plain_best']:>12.3f}{result['plain_evals']:>8}{result['surrogate_best']:>12.3f}"
+              f"{result['surrogate_evals']:>8}{str(result['evals_to_plain_best']):>15}{result['plain_best_at_evals']:>15.3f}")
+    return results
+
+
+def fidelity_benchmark(num_bots=20, num_iter=30, seeds=range(5), eval_mode="batch",
+                       schedule=({"horizon": 0.25, "iterations": 10}, {"horizon": 0.5, "iterations": 10})):
+    '''
+    Training time & final (full fidelity) score
+    of a plain run and of a run following the
+    fidelity schedule, for every seed on the
+    same path and number of iterations, and the
+    best score of the plain run once it had
+    trained as long as the scheduled run
+    
+    '''
+    
+    path = get_path(random_flag=0)
+    params = dict(etc_pso_params, path=path)
+    results = []
+    print(f"{'seed':>6}{'plain score':>13}{'time (s)':>10}{'sched. score':>14}{'time (s)':>10}{'plain @ time':>14}")
+    for seed in seeds:
+        result = {"seed": seed}
+        for name, curr_schedule in (("plain", None), ("scheduled", list(schedule))):
+            pso = PSO(num_bots, eval_mode=eval_mode, seed=seed, **params)
+            start = time.perf_counter()
+            output = pso.train(num_iter, pso_params["learning_rate"], verbose=False, fidelity_schedule=curr_schedule)
+            result[f"{name}_time"] = time.perf_counter() - start
+            result[f"{name}_score"] = output["max_score"]
+            if curr_schedule is None:
+                plain = output
+        at_time = np.searchsorted(plain["time_history"], result["scheduled_time"], side="right") - 1
+        result["plain_score_at_time"] = plain["best_scores_history"][max(at_time, 0)]
+        results.append(result)
+        print(f"{seed:>6}{result['plain_score']:>13.3f}{result['plain_time']:>10.2f}"
+              f"{result['scheduled_score']:>14.3f}{result['scheduled_time']:>10.2f}{result['plain_score_at_time']:>14.3f}")
+    return results
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Benchmark suite of the hot paths, on a fixed
+path (get_path(random_flag=0)) with fixed seeds;
+every timing is the best of repeats runs and the
+results {name: {"value", "unit", "higher_is_better"}}
+are saved as JSON, to be compared against a baseline
+
+'''
+
+def best_time(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_suite(folder, repeats=3, swarm_sizes=(10, 50, 200), seed=0):
+    matplotlib.use("Agg")
+    path = get_path(random_flag=0)
+    params = dict(etc_pso_params, path=path)
+    rng = np.random.default_rng(seed)
+    vars = params["init_guess"] + (rng.random((50, params["init_guess"].shape[0]))-0.5)*params["range_var"]
+    results = {}
+    
+    def record(name, value, unit, higher_is_better=False):
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:<32}{value:>14.4g} {unit}")
+    
+    # Simulation steps per second of ETC_PSO_Member.eval
+    for kernel in ("numpy", "scalar", "event"):
+        bot = ETC_PSO_Member(**dict(params, kernel=kernel))
+        def evals():
+            num_steps = 0
+            for curr_vars in vars:
+                bot.vars = np.copy(curr_vars)
+                bot.eval()
+                num_steps += bot.num_steps
+            return num_steps
+        record(f"member_eval.{kernel}", evals()/best_time(evals, repeats), "steps/s", True)
+    
+    # eval_all only moves the bests, so every repeat simulates the same swarm
+    for num_bots in swarm_sizes:
+        for eval_mode in ("serial", "batch"):
+            pso = PSO(num_bots, eval_mode=eval_mode, seed=seed, **params)
+            record(f"eval_all.{eval_mode}.{num_bots}", best_time(pso.eval_all, repeats), "s")
+    
+    for num_bots in swarm_sizes:
+        train = lambda: PSO(num_bots, eval_mode="batch", seed=seed, **params).train(3, pso_params["learning_rate"], verbose=False)
+        record(f"train.batch.{num_bots}", best_time(train, repeats), "s")
+    
+    record("get_coord", best_time(get_coord, repeats), "s")
+    record("get_path", best_time(lambda: get_path(random_flag=0), repeats), "s")
+    
+    init_guess = params["init_guess"]
+    for render in (False, True):
+        game = GameHandler(**dict(game_params, headless=True, render=render))
+        def simulate():
+            game.load_bot(path, init_guess[0:2], init_guess[2:4], init_guess[4:6])
+            game.simulate(init_guess[-1], plot_flag=1)
+        record(f"game_simulate.{'render' if render else 'no_render'}", best_time(simulate, repeats), "s")
+    game.quit()
+    
+    # Plots & GIFs of main.RUN on a short training run
+    output = PSO(10, eval_mode="batch", seed=seed, **params).train(10, pso_params["learning_rate"], verbose=False)
+    bot = ETC_PSO_Member(**params)
+    bot.vars = init_guess
+    bot.eval()
+    os.makedirs(os.path.join(folder, "plots"), exist_ok=True)
+    record("plot_training", best_time(lambda: PLOT_TRAINING(os.path.join(folder, "plots", "run"), output, bot, 10), 1), "s")
+    plt.close("all")
+    
+    return {"meta": {"created": datetime.now().isoformat(timespec="seconds"),
+                     "python": sys.version.split()[0],
+                     "numpy": np.__version__,
+                     "platform": platform.platform(),
+                     "repeats": repeats,
+                     "seed": seed},
+            "results": results}
+
+
+def save_results(results, file):
+    with open(file, "w") as curr_file:
+        json.dump(results, curr_file, indent=2)
+
+
+def compare(baseline_file, results_file, tolerance=0.1):
+    '''
+    Every benchmark present in both files is a
+    regression if it got worse than the baseline
+    by more than tolerance (relative); returns
+    the names of the regressions
+
+    '''
+
+    with open(baseline_file) as curr_file:
+        baseline = json.load(curr_file)["results"]
+    with open(results_file) as curr_file:
+        results = json.load(curr_file)["results"]
+
+    regressions = []
+    print(f"{'benchmark':<32}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base, value = baseline[name]["value"], result["value"]
+        change = value/base - 1 if base else 0.
+        worse = -change if result["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif worse < -tolerance:
+            flag = "improved"
+        print(f"{name:<32}{base:>12.4g}{value:>12.4g}{change*100:>9.1f}% {flag}")
+    return regressions
+
+
+############################################################################################
+############################################################################################
@@ -1,5 +1,55 @@
+import math
 import numpy as np
-from functools import partial
+from .path_geometry import as_geometry
+from .trajectory_recorder import TrajectoryRecorder
+from .swarm_state import SwarmState
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Norm & quadratic forms of 2 dimensional vectors
+(or of every row of a stack of them) written out
+element-wise; BLAS reductions may fuse the
+multiply-adds, these round the same way in
+the numpy, scalar and batch kernels
+
+'''
+
+def norm_2d(x):
+    return np.sqrt(x[..., 0]*x[..., 0] + x[..., 1]*x[..., 1])
+
+
+def quad_form(x, Q):
+    return ((x[..., 0]*Q[0, 0] + x[..., 1]*Q[1, 0])*x[..., 0]
+            + (x[..., 0]*Q[0, 1] + x[..., 1]*Q[1, 1])*x[..., 1])
+
+
+'''
+Upper bound on the final score of a running rollout,
+used for aborting it early: every remaining step adds
+at most 0.35 while the error terms only grow; a step
+taken farther than 50 from its waypoint also adds at
+least dt*50^2*min(err.T @ Q_err @ err | err[0] = 1)
+to avg_error, and at most (num_way_points - curr_index)
+of the remaining steps can be closer than that
+
+'''
+
+def far_step_gain(dt, Q_err):
+    min_err = Q_err[0, 0]
+    if Q_err[1, 1] > 0:
+        min_err -= (Q_err[0, 1] + Q_err[1, 0])**2/(4*Q_err[1, 1])
+    return max(0., 0.35 - dt*50.**2*max(0., min_err))
+
+
+def score_bound(count_with_ttc, count_with_etc, avg_error, curr_index, num_way_points, max_count, far_gain):
+    remaining = max_count - count_with_ttc
+    near = np.minimum(remaining, num_way_points - curr_index)
+    return (1e3 + (count_with_ttc - count_with_etc + near)*0.35
+            + (remaining - near)*far_gain - avg_error)
 
 
 ############################################################################################
@@ -27,7 +77,7 @@ class Bot():
         '''
         For refreshing the states
         and loading new parameters:
-        path coordinates, P, I, D
+        path (coordinates or PathGeometry), P, I, D
         
         '''
         
@@ -35,17 +85,15 @@ class Bot():
         self.I = I
         self.D = D
         self.curr_index = 0
-        self.path_coord = path
-        self.num_way_points = path.shape[0]
+        self.path = as_geometry(path)
+        self.path_coord = self.path.way_points
+        self.num_way_points = self.path.num_way_points
         self.err = np.zeros(self.num_inputs)
         self.prev_err = np.zeros_like(self.err)
         self.curr_state = np.zeros(self.num_states)
         
-        init_pos = path[0]
-        init_dir = path[1] - path[0]
-        init_angle = np.arctan2(init_dir[1], init_dir[0])
-        self.curr_state[-1] = init_angle
-        self.curr_state[:2] = init_pos
+        self.curr_state[-1] = self.path.init_angle
+        self.curr_state[:2] = self.path.init_pos
         self.dir = self.get_dir()
 
 
@@ -60,8 +108,8 @@ class Bot():
         '''
         
         del_pos = self.curr_state[:2] - self.path_coord[self.curr_index]
-        self.err[0] = np.linalg.norm(del_pos)
-        self.err[1] = np.cross(self.dir, del_pos)/(self.err[0]+1e-3)
+        self.err[0] = norm_2d(del_pos)
+        self.err[1] = (self.dir[0]*del_pos[1] - self.dir[1]*del_pos[0])/(self.err[0]+1e-3)
         
         velocities = (self.err*self.P
                       + (self.err+self.prev_err)*self.I*0.5
@@ -99,25 +147,131 @@ class ETC_PSO_Member(Bot):
     '''
     Child Class for BOT simulation in PSO
     
+    kernel -> "numpy": steps the Bot methods on numpy arrays
+              "scalar": same arithmetic on plain floats (faster)
+              "event": jumps from event to event along the
+              closed form arc of the constant input (see
+              rollout_event; early_abort is not applied)
+    early_abort -> Stops a rollout as soon as it provably
+                   cannot beat the personal best score
+    path -> One path, or a bank (list) of paths; with a bank
+            the member is scored on all of them at once by
+            ETC_PSO_Batch and the scores are combined by
+            aggregate ("mean", "min" or a quantile)
+    profiler -> RolloutProfiler timing every rollout of the
+                configured kernel (phase by phase for "numpy",
+                as a whole for "scalar" & "event", see
+                rollout_timed); None for no profiling
+    swarm -> SwarmState holding vars, personal_best and
+             best_score of the member in its row index
+             (a state of its own if None)
+    
     '''
     
-    def __init__(self, path, dt, max_iter, Q_err, Q_ETC, init_guess, range_var):
+    def __init__(self, path, dt, max_iter, Q_err, Q_ETC, init_guess, range_var, rng=None, kernel="numpy", cache=None, early_abort=False, aggregate="mean", profiler=None, swarm=None, index=0):
         self.Q = Q_ETC
         self.Q_ = Q_err
+        self.cache = cache
+        self.profiler = profiler
+        self.aborted = False
+        self.num_steps = 0
+        self.index = index
+        self.swarm = swarm if swarm is not None else SwarmState(1, np.shape(init_guess)[0])
         self.best_score = 0.
         super().__init__(dt)
-        self.max_iter = max_iter
-        self.load = partial(self.load, path)
+        self.kernel = kernel
+        self.aggregate = aggregate
+        self.early_abort = early_abort
+        self.configure(path, dt, max_iter)
+        
+        # Scoring only needs the distance travelled, so no trajectory is recorded
+        self.recorder = TrajectoryRecorder(record=False)
+        
+        # Every member owns its random stream so that its updates do not
+        # depend on the order in which the swarm gets evaluated
+        self.rng = np.random.default_rng(rng)
         
         # Generating design varaibles randomly in the vicinity of an initial guess
-        self.vars = init_guess + (np.random.random((3*self.num_inputs+1))-0.5)*range_var
+        self.vars = init_guess + (self.rng.random((3*self.num_inputs+1))-0.5)*range_var
         self.personal_best = np.copy(self.vars)
 
 
-    def get_dist_covered(self, traj):
+    @property
+    def vars(self):
+        return self.swarm.vars[self.index]
+
+
+    @vars.setter
+    def vars(self, vars):
+        self.swarm.vars[self.index] = vars
+
+
+    @property
+    def personal_best(self):
+        return self.swarm.personal_best[self.index]
+
+
+    @personal_best.setter
+    def personal_best(self, vars):
+        self.swarm.personal_best[self.index] = vars
+
+
+    @property
+    def best_score(self):
+        return self.swarm.best_score[self.index]
+
+
+    @best_score.setter
+    def best_score(self, score):
+        self.swarm.best_score[self.index] = score
+
+
+    def configure(self, path, dt, max_iter):
+        '''
+        Sets the path (or bank of paths), time step
+        and horizon the member is simulated with;
+        called again to change the fidelity of a
+        member while it keeps its design variables,
+        bests & random stream
+        
+        '''
+        
+        self.dt = dt
+        self.max_iter = max_iter
+        self.max_count = int(max_iter)+2
+        self.far_gain = far_step_gain(dt, self.Q_)
+        
+        # Scores of already simulated design variables can be shared through a FitnessCache
+        path = as_geometry(path)
+        if self.cache is not None:
+            self.cache_context = self.cache.context(path, dt, max_iter, self.Q_, self.Q, self.aggregate)
+        
+        # With a bank of paths the Bot itself is loaded with the first one
+        self.path_bank = None
+        if isinstance(path, list):
+            self.path_bank = ETC_PSO_Batch(path, dt, max_iter, self.Q_, self.Q, aggregate=self.aggregate, profiler=self.profiler)
+            path = path[0]
+        self.path = path
+    
+    
+    @staticmethod
+    def get_dist_covered(traj):
         del_traj = traj - np.roll(traj, shift = -1, axis=0)
         tot_dist = np.sum(np.linalg.norm(del_traj[:-1,:], axis=1))
         return tot_dist
+    
+    
+    def get_abort_level(self):
+        '''
+        Once score_bound is not above the personal
+        best the rollout can not change anything;
+        a small margin covers rounding in the bound
+        
+        '''
+        
+        if self.early_abort:
+            return self.best_score - 1e-6
+        return -np.inf
 
 
     def eval(self):
@@ -130,24 +284,93 @@ class ETC_PSO_Member(Bot):
         
         ''' 
         
-        bot_traj = []
-        avg_error = 0.
-        running = True
-        count_with_ttc = 0
-        count_with_etc = 0
-        prev_vels = np.zeros(self.num_inputs)
-        
         '''
         Deciphering P, I, D and Event Triggering thresh
         from the design variables learnt using PSO
         
         '''
         
+        # Cleared first, so a cache hit never reports an earlier abort
+        self.aborted = False
         self.thresh = self.vars[-1]
-        self.load(P = self.vars[:self.num_inputs],
+        self.load(self.path,
+                  P = self.vars[:self.num_inputs],
                   I = self.vars[self.num_inputs:2*self.num_inputs],
                   D = self.vars[2*self.num_inputs:3*self.num_inputs])
-
+        
+        if self.cache is not None:
+            key = self.cache.key(self.cache_context, self.vars)
+            score = self.cache.get(key)
+            if score is not None:
+                self.update_best(score)
+                return score
+        
+        if self.path_bank is not None:
+            score = self.path_bank.eval(self.vars[None])[0]
+            if self.cache is not None:
+                self.cache.put(key, score)
+            self.update_best(score)
+            return score
+        
+        if self.kernel == "scalar":
+            rollout = self.rollout_scalar
+        elif self.kernel == "event":
+            rollout = self.rollout_event
+        else:
+            rollout = self.rollout if self.profiler is None else self.rollout_profiled
+        
+        if self.profiler is not None and self.kernel in ("scalar", "event"):
+            count_with_ttc, count_with_etc, avg_error, dist_covered = self.rollout_timed(rollout)
+        else:
+            count_with_ttc, count_with_etc, avg_error, dist_covered = rollout()
+        self.num_steps = count_with_ttc
+        
+        '''
+        An aborted rollout is flagged and scored by the
+        bound that stopped it, which does not exceed the
+        personal best; it is not cached as it depends
+        on the personal best at that time
+        
+        '''
+        
+        if self.aborted:
+            return score_bound(count_with_ttc, count_with_etc, avg_error, self.curr_index,
+                               self.num_way_points, self.max_count, self.far_gain)
+        
+        '''
+        Final Score is calculated based on bot's performance
+        and the personal best design vairbales along with the
+        personal best score for the current member are updated
+        if the score is higher than the previous personal best
+        
+        '''
+        
+        traj_diff = dist_covered - self.path.length
+        
+        score = (1e3 + (count_with_ttc - count_with_etc)*0.35
+                 - (np.abs(traj_diff))*0.65 - avg_error)
+        
+        if self.cache is not None:
+            self.cache.put(key, score)
+        self.update_best(score)
+        return score
+    
+    
+    def rollout(self):
+        '''
+        Simulation using the Bot methods on
+        numpy arrays (reference kernel)
+        
+        '''
+        
+        bot_traj = self.recorder
+        bot_traj.reset()
+        avg_error = 0.
+        running = True
+        count_with_ttc = 0
+        count_with_etc = 0
+        abort_level = self.get_abort_level()
+        prev_vels = np.zeros(self.num_inputs)
         
         while running:
             stop_flag, vels = self.get_vels()
@@ -164,7 +387,7 @@ class ETC_PSO_Member(Bot):
             '''
             
             del_vels = vels - prev_vels
-            if del_vels.T @ self.Q @ del_vels >= self.thresh:
+            if quad_form(del_vels, self.Q) >= self.thresh:
                 self.step_sim(vels)
                 count_with_etc += 1
                 prev_vels = np.copy(vels)
@@ -180,33 +403,616 @@ class ETC_PSO_Member(Bot):
             
             '''
             
-            curr_error = self.err.T @ self.Q_ @ self.err
+            curr_error = quad_form(self.err, self.Q_)
             if curr_error > 1e2 or count_with_ttc > self.max_iter:
                 running = False
                 
             count_with_ttc += 1
             avg_error += curr_error*self.dt
-            bot_traj.append(np.copy(self.curr_state[:2]))
+            bot_traj.append(self.curr_state[0], self.curr_state[1])
+            
+            if running and score_bound(count_with_ttc, count_with_etc, avg_error, self.curr_index,
+                                       self.num_way_points, self.max_count, self.far_gain) <= abort_level:
+                self.aborted = True; break
         
+        return count_with_ttc, count_with_etc, avg_error, bot_traj.dist
+    
+    
+    def rollout_profiled(self):
         '''
-        Final Score is calculated based on bot's performance
-        and the personal best design vairbales along with the
-        personal best score for the current member are updated
-        if the score is higher than the previous personal best
+        Same simulation as rollout, with every phase
+        timed by the profiler and the reason the
+        rollout ended recorded; it is kept apart so
+        that the other kernels pay nothing for it
         
         '''
         
-        traj_diff = (self.get_dist_covered(np.array(bot_traj))
-                     - self.get_dist_covered(self.path_coord))
+        profiler = self.profiler
+        bot_traj = self.recorder
+        bot_traj.reset()
+        avg_error = 0.
+        count_with_ttc = 0
+        count_with_etc = 0
+        reason = "path_end"
+        abort_level = self.get_abort_level()
+        prev_vels = np.zeros(self.num_inputs)
         
-        score = (1e3 + (count_with_ttc - count_with_etc)*0.35
-                 - (np.abs(traj_diff))*0.65 - avg_error)
+        profiler.start()
+        while True:
+            stop_flag, vels = self.get_vels()
+            profiler.lap("get_vels")
+            if stop_flag: break
+            
+            trigger = quad_form(vels - prev_vels, self.Q) >= self.thresh
+            if trigger:
+                count_with_etc += 1
+                prev_vels = np.copy(vels)
+            profiler.steps += 1
+            profiler.fired += trigger
+            profiler.lap("trigger")
+            
+            self.step_sim(prev_vels)
+            profiler.lap("step_sim")
+            
+            curr_error = quad_form(self.err, self.Q_)
+            if curr_error > 1e2:
+                reason = "error"
+            elif count_with_ttc > self.max_iter:
+                reason = "max_iter"
+            
+            count_with_ttc += 1
+            avg_error += curr_error*self.dt
+            bot_traj.append(self.curr_state[0], self.curr_state[1])
+            
+            if reason == "path_end" and score_bound(count_with_ttc, count_with_etc, avg_error, self.curr_index,
+                                                    self.num_way_points, self.max_count, self.far_gain) <= abort_level:
+                self.aborted = True
+                reason = "aborted"
+            profiler.lap("bookkeeping")
+            if reason != "path_end": break
+        
+        profiler.terminate(reason)
+        return count_with_ttc, count_with_etc, avg_error, bot_traj.dist
+    
+    
+    def rollout_timed(self, rollout):
+        '''
+        The fused scalar & event kernels are timed as
+        a whole (the "rollout" phase), as splitting
+        their steps into phases would slow them down;
+        steps, triggers & the reason the rollout
+        ended are read off its final state
+        
+        '''
+        
+        profiler = self.profiler
+        profiler.start()
+        result = rollout()
+        profiler.lap("rollout")
+        
+        count_with_ttc, count_with_etc = result[:2]
+        profiler.steps += count_with_ttc
+        profiler.fired += count_with_etc
+        if self.aborted:
+            profiler.terminate("aborted")
+        elif self.curr_index == self.num_way_points:
+            profiler.terminate("path_end")
+        elif quad_form(self.err, self.Q_) > 1e2:
+            profiler.terminate("error")
+        else:
+            profiler.terminate("max_iter")
+        return result
+    
+    
+    def rollout_scalar(self):
+        '''
+        Same simulation as rollout, but the states,
+        errors and inputs are kept in plain floats
+        and the quadratics are expanded by hand, so
+        no small arrays are created per step; the
+        distance travelled is accumulated exactly
+        like TrajectoryRecorder does it
+        
+        '''
+        
+        P_0, P_1 = float(self.P[0]), float(self.P[1])
+        I_0, I_1 = float(self.I[0]), float(self.I[1])
+        D_0, D_1 = float(self.D[0]), float(self.D[1])
+        thresh, dt, max_iter = float(self.thresh), self.dt, self.max_iter
+        max_count, far_gain, abort_level = self.max_count, self.far_gain, self.get_abort_level()
+        Q_00, Q_01, Q_10, Q_11 = self.Q.ravel().tolist()
+        R_00, R_01, R_10, R_11 = self.Q_.ravel().tolist()
+        
+        x, y, theta = self.curr_state.tolist()
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        path = self.path.points
+        num_way_points = self.num_way_points
+        
+        curr_index = 0
+        avg_error = 0.
+        dist_covered = 0.
+        count_with_ttc = 0
+        count_with_etc = 0
+        err_0 = err_1 = 0.
+        prev_vel_0 = prev_vel_1 = 0.
+        
+        while True:
+            prev_err_0, prev_err_1 = err_0, err_1
+            del_x = x - path[curr_index][0]
+            del_y = y - path[curr_index][1]
+            err_0 = math.sqrt(del_x*del_x + del_y*del_y)
+            err_1 = (cos_t*del_y - sin_t*del_x)/(err_0+1e-3)
+            
+            vel_0 = err_0*P_0 + (err_0+prev_err_0)*I_0*0.5 + (err_0-prev_err_0)*D_0
+            vel_1 = err_1*P_1 + (err_1+prev_err_1)*I_1*0.5 + (err_1-prev_err_1)*D_1
+            
+            if err_0 <= 50.:
+                curr_index += 1
+                if curr_index == num_way_points: break
+            
+            del_vel_0 = vel_0 - prev_vel_0
+            del_vel_1 = vel_1 - prev_vel_1
+            if ((del_vel_0*Q_00 + del_vel_1*Q_10)*del_vel_0
+                + (del_vel_0*Q_01 + del_vel_1*Q_11)*del_vel_1) >= thresh:
+                count_with_etc += 1
+                prev_vel_0, prev_vel_1 = vel_0, vel_1
+            
+            x += prev_vel_0*dt*cos_t
+            y += prev_vel_0*dt*sin_t
+            theta += prev_vel_1*dt
+            cos_t, sin_t = math.cos(theta), math.sin(theta)
+            if abs(theta) >= math.pi:
+                theta = -theta
+            
+            curr_error = ((err_0*R_00 + err_1*R_10)*err_0
+                          + (err_0*R_01 + err_1*R_11)*err_1)
+            running = not (curr_error > 1e2 or count_with_ttc > max_iter)
+            
+            if count_with_ttc:
+                del_x = x - prev_x
+                del_y = y - prev_y
+                dist_covered += math.sqrt(del_x*del_x + del_y*del_y)
+            prev_x, prev_y = x, y
+            count_with_ttc += 1
+            avg_error += curr_error*dt
+            if not running: break
+            
+            remaining = max_count - count_with_ttc
+            near = min(remaining, num_way_points - curr_index)
+            if (1e3 + (count_with_ttc - count_with_etc + near)*0.35
+                + (remaining - near)*far_gain - avg_error) <= abort_level:
+                self.aborted = True; break
+        
+        self.err[:] = err_0, err_1
+        self.curr_index = curr_index
+        self.curr_state[:] = x, y, theta
+        
+        return count_with_ttc, count_with_etc, avg_error, dist_covered
+    
+    
+    def rollout_event(self):
+        '''
+        Event driven version of the simulation:
+        between two events the input is constant,
+        so the heading after j steps of dt is
+        theta + j*w (w = angular velocity*dt) and
+        the position has the closed form
+        
+        pos + v*dt*sin(j*w/2)/sin(w/2)*[cos, sin](theta + (j-1)*w/2)
+        
+        The trigger, waypoint (error <= 50), error bound,
+        max_iter and heading flip (|theta| >= pi) conditions
+        are evaluated on this arc for a window of steps
+        at once and the rollout jumps straight to the first
+        step where one of them holds, which is then taken
+        like in rollout_scalar; the error & distance of the
+        steps jumped over are summed up on the way. While
+        events come every few steps, single steps are
+        cheaper than windows and are taken instead
+        
+        Scores match the fixed step kernels to rounding
+        (within 1e-6 of the score); a condition that holds
+        only by a rounding error may still flip the outcome
+        of a step. The number of Python-level iterations
+        (self.num_events) only drops well below the number
+        of steps when the threshold is large: ~1.2x fewer
+        at the default threshold, ~29x fewer at 100x of it
+        on the generated path
+        
+        '''
+        
+        P_0, P_1 = float(self.P[0]), float(self.P[1])
+        I_0, I_1 = float(self.I[0]), float(self.I[1])
+        D_0, D_1 = float(self.D[0]), float(self.D[1])
+        thresh, dt, max_iter = float(self.thresh), self.dt, self.max_iter
+        Q_00, Q_01, Q_10, Q_11 = self.Q.ravel().tolist()
+        R_00, R_01, R_10, R_11 = self.Q_.ravel().tolist()
+        
+        x, y, theta = self.curr_state.tolist()
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        way_points = self.path.way_points
+        path = self.path.points
+        num_way_points = self.num_way_points
+        steps = np.arange(self.max_count + 2, dtype=float)
+        
+        gap = 0
+        window = 16
+        curr_index = 0
+        avg_error = 0.
+        dist_covered = 0.
+        count_with_ttc = 0
+        count_with_etc = 0
+        err_0 = err_1 = 0.
+        prev_vel_0 = prev_vel_1 = 0.
+        self.num_events = 0
+        
+        while True:
+            self.num_events += 1
+            
+            if gap < 8:
+                prev_err_0, prev_err_1 = err_0, err_1
+                del_x = x - path[curr_index][0]
+                del_y = y - path[curr_index][1]
+                err_0 = math.sqrt(del_x*del_x + del_y*del_y)
+                err_1 = (cos_t*del_y - sin_t*del_x)/(err_0+1e-3)
+                vel_0 = err_0*P_0 + (err_0+prev_err_0)*I_0*0.5 + (err_0-prev_err_0)*D_0
+                vel_1 = err_1*P_1 + (err_1+prev_err_1)*I_1*0.5 + (err_1-prev_err_1)*D_1
+            
+            else:
+                '''
+                States before each of the next window steps
+                (and the one after them) on the current arc;
+                like in step_sim, the direction after a heading
+                flip is still the one before it for one step
+                
+                '''
+                
+                window = min(window, self.max_count - count_with_ttc + 1)
+                j = steps[:window+1]
+                w = prev_vel_1*dt
+                heading = theta + j*w
+                cos_h, sin_h = np.cos(heading), np.sin(heading)
+                cos_h[0], sin_h[0] = cos_t, sin_t
+                ratio = np.sin(j*w*0.5)/math.sin(w*0.5) if w else j
+                arc_x = x + prev_vel_0*dt*ratio*np.cos(theta + (j-1)*w*0.5)
+                arc_y = y + prev_vel_0*dt*ratio*np.sin(theta + (j-1)*w*0.5)
+                arc_x[1:] += prev_vel_0*dt*(cos_t - math.cos(theta))
+                arc_y[1:] += prev_vel_0*dt*(sin_t - math.sin(theta))
+                
+                del_x = arc_x[:-1] - way_points[curr_index, 0]
+                del_y = arc_y[:-1] - way_points[curr_index, 1]
+                e_0 = np.sqrt(del_x*del_x + del_y*del_y)
+                e_1 = (cos_h[:-1]*del_y - sin_h[:-1]*del_x)/(e_0+1e-3)
+                pe_0 = np.concatenate(([err_0], e_0[:-1]))
+                pe_1 = np.concatenate(([err_1], e_1[:-1]))
+                
+                v_0 = e_0*P_0 + (e_0+pe_0)*I_0*0.5 + (e_0-pe_0)*D_0
+                v_1 = e_1*P_1 + (e_1+pe_1)*I_1*0.5 + (e_1-pe_1)*D_1
+                dv_0 = v_0 - prev_vel_0
+                dv_1 = v_1 - prev_vel_1
+                
+                curr_error = (e_0*R_00 + e_1*R_10)*e_0 + (e_0*R_01 + e_1*R_11)*e_1
+                event = ((e_0 <= 50.)
+                         | (((dv_0*Q_00 + dv_1*Q_10)*dv_0 + (dv_0*Q_01 + dv_1*Q_11)*dv_1) >= thresh)
+                         | (curr_error > 1e2)
+                         | (count_with_ttc + j[:-1] > max_iter)
+                         | (np.abs(heading[1:]) >= math.pi))
+                num_plain = int(np.argmax(event)) if event.any() else window
+                
+                # Steps without any event are jumped over
+                if num_plain:
+                    avg_error += float(np.sum(curr_error[:num_plain]*dt))
+                    dist_covered += abs(prev_vel_0*dt)*(num_plain - (count_with_ttc == 0))
+                    count_with_ttc += num_plain
+                    x, y, theta = float(arc_x[num_plain]), float(arc_y[num_plain]), float(heading[num_plain])
+                    cos_t, sin_t = float(cos_h[num_plain]), float(sin_h[num_plain])
+                
+                if num_plain == window:
+                    err_0, err_1 = float(e_0[-1]), float(e_1[-1])
+                    window *= 2
+                    continue
+                window = 16
+                
+                err_0, err_1 = float(e_0[num_plain]), float(e_1[num_plain])
+                vel_0, vel_1 = float(v_0[num_plain]), float(v_1[num_plain])
+            
+            '''
+            The step itself, exactly as in rollout_scalar;
+            steps without events are counted in gap
+            
+            '''
+            
+            gap += 1
+            if err_0 <= 50.:
+                gap = 0
+                curr_index += 1
+                if curr_index == num_way_points: break
+            
+            del_vel_0 = vel_0 - prev_vel_0
+            del_vel_1 = vel_1 - prev_vel_1
+            if ((del_vel_0*Q_00 + del_vel_1*Q_10)*del_vel_0
+                + (del_vel_0*Q_01 + del_vel_1*Q_11)*del_vel_1) >= thresh:
+                gap = 0
+                count_with_etc += 1
+                prev_vel_0, prev_vel_1 = vel_0, vel_1
+            
+            step_x = prev_vel_0*dt*cos_t
+            step_y = prev_vel_0*dt*sin_t
+            x += step_x
+            y += step_y
+            theta += prev_vel_1*dt
+            cos_t, sin_t = math.cos(theta), math.sin(theta)
+            if abs(theta) >= math.pi:
+                gap = 0
+                theta = -theta
+            
+            curr_error = ((err_0*R_00 + err_1*R_10)*err_0
+                          + (err_0*R_01 + err_1*R_11)*err_1)
+            running = not (curr_error > 1e2 or count_with_ttc > max_iter)
+            if count_with_ttc:
+                dist_covered += math.sqrt(step_x*step_x + step_y*step_y)
+            count_with_ttc += 1
+            avg_error += curr_error*dt
+            if not running: break
+        
+        self.err[:] = err_0, err_1
+        self.curr_index = curr_index
+        self.curr_state[:] = x, y, theta
+        
+        return count_with_ttc, count_with_etc, avg_error, dist_covered
+    
+    
+    def update_best(self, score):
+        '''
+        Personal best design variables and
+        score are updated if the new score
+        is higher than the previous best
+        
+        '''
         
         if score > self.best_score:
             self.personal_best = np.copy(self.vars)
             self.best_score = score
-        return score
         
         
 ############################################################################################
-############################################################################################
\ No newline at end of file
+############################################################################################
+
+class ETC_PSO_Batch():
+    '''
+    Vectorised counterpart of ETC_PSO_Member
+    for simulating the whole swarm at once;
+    every particle is a row of (num_bots, 3)
+    state arrays, so the only Python loop
+    left is the one over time steps
+    
+    path can also be a bank (list) of paths,
+    then every particle is simulated on all
+    of them in the same loop and its scores
+    are combined by aggregate:
+    "mean", "min" (worst case) or a quantile (0 to 1)
+    
+    With a RolloutProfiler every phase of a time
+    step is timed for the whole swarm at once and
+    the rows are counted by the reason they stopped
+    
+    '''
+    
+    def __init__(self, path, dt, max_iter, Q_err, Q_ETC, early_abort=False, aggregate="mean", profiler=None, **kwargs):
+        self.dt = dt
+        self.profiler = profiler
+        self.Q = Q_ETC
+        self.Q_ = Q_err
+        self.max_iter = max_iter
+        self.aggregate = aggregate
+        self.early_abort = early_abort
+        self.max_count = int(max_iter)+2
+        self.far_gain = far_step_gain(dt, Q_err)
+        
+        # Paths of different lengths are padded with their last waypoint,
+        # which is never reached as the rollout stops at num_way_points
+        paths = as_geometry(path)
+        paths = paths if isinstance(paths, list) else [paths]
+        self.num_paths = len(paths)
+        self.num_way_points = np.array([curr_path.num_way_points for curr_path in paths])
+        self.path_coord = np.zeros((self.num_paths, np.max(self.num_way_points), 2))
+        for index, curr_path in enumerate(paths):
+            self.path_coord[index, :curr_path.num_way_points] = curr_path.way_points
+            self.path_coord[index, curr_path.num_way_points:] = curr_path.way_points[-1]
+        
+        self.path_dist = np.array([curr_path.length for curr_path in paths])
+        self.init_angle = np.array([curr_path.init_angle for curr_path in paths])
+    
+    
+    def aggregate_scores(self, path_scores):
+        if self.aggregate == "mean":
+            return np.mean(path_scores, axis=1)
+        if self.aggregate == "min":
+            return np.min(path_scores, axis=1)
+        return np.quantile(path_scores, self.aggregate, axis=1)
+    
+    
+    def eval(self, vars, best_scores=None):
+        '''
+        For simulating all the design variables
+        (one row per particle) simultaneously and
+        returning their scores; the arithmetic
+        mirrors ETC_PSO_Member.eval step by step
+        so the scores are identical to the serial
+        ones; with early_abort the personal best
+        scores are needed and the rows that were
+        stopped are flagged in self.aborted
+        (a bound on one path says nothing about
+        the aggregate, so a bank is never aborted)
+        
+        Scores on the individual paths are kept
+        in self.path_scores (num_particles, num_paths)
+        and the terms of every score (trigger & step
+        counts, error, path length error and whether
+        the path was completed) in self.rollout_stats,
+        one row per particle & path
+        
+        '''
+        
+        num_particles = vars.shape[0]
+        path_id = np.tile(np.arange(self.num_paths), num_particles)
+        vars = np.repeat(vars, self.num_paths, axis=0)
+        num_bots = vars.shape[0]
+        
+        abort_level = np.full(num_bots, -np.inf)
+        if self.early_abort and best_scores is not None and self.num_paths == 1:
+            abort_level[:] = best_scores - 1e-6
+        curr_state = np.zeros((num_bots, 3))
+        curr_state[:, :2] = self.path_coord[path_id, 0]
+        curr_state[:, -1] = self.init_angle[path_id]
+        
+        '''
+        States of the particles still running; rows
+        are dropped from these arrays as soon as
+        the corresponding particle terminates and
+        "ids" maps them back to the swarm
+        
+        '''
+        
+        live = {"ids": np.arange(num_bots),
+                "path_id": path_id,
+                "P": vars[:, 0:2],
+                "I": vars[:, 2:4],
+                "D": vars[:, 4:6],
+                "thresh": vars[:, -1],
+                "curr_state": curr_state,
+                "dir": np.stack((np.cos(curr_state[:, -1]), np.sin(curr_state[:, -1])), axis=1),
+                "curr_index": np.zeros(num_bots, dtype=int),
+                "prev_err": np.zeros((num_bots, 2)),
+                "prev_vels": np.zeros((num_bots, 2)),
+                "avg_error": np.zeros(num_bots),
+                "dist_covered": np.zeros(num_bots),
+                "abort_level": abort_level,
+                "count_with_etc": np.zeros(num_bots, dtype=int)}
+        
+        avg_error = np.zeros(num_bots)
+        dist_covered = np.zeros(num_bots)
+        self.aborted = np.zeros(num_bots, dtype=bool)
+        count_with_etc = np.zeros(num_bots, dtype=int)
+        count_with_ttc = np.zeros(num_bots, dtype=int)
+        
+        curr_index = np.zeros(num_bots, dtype=int)
+        completed = np.zeros(num_bots, dtype=bool)
+        
+        def terminate(live, stop_flag, step, aborted=False):
+            stopped = live["ids"][stop_flag]
+            self.aborted[stopped] = aborted
+            curr_index[stopped] = live["curr_index"][stop_flag]
+            avg_error[stopped] = live["avg_error"][stop_flag]
+            dist_covered[stopped] = live["dist_covered"][stop_flag]
+            count_with_etc[stopped] = live["count_with_etc"][stop_flag]
+            count_with_ttc[stopped] = step
+            return {key: val[~stop_flag] for key, val in live.items()}
+        
+        step = 0
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        while live["ids"].size:
+            curr_state, dir = live["curr_state"], live["dir"]
+            
+            del_pos = curr_state[:, :2] - self.path_coord[live["path_id"], live["curr_index"]]
+            err_0 = norm_2d(del_pos)
+            err_1 = (dir[:, 0]*del_pos[:, 1] - dir[:, 1]*del_pos[:, 0])/(err_0+1e-3)
+            err = np.stack((err_0, err_1), axis=1)
+            
+            prev_err = live["prev_err"]
+            live["vels"] = (err*live["P"]
+                            + (err+prev_err)*live["I"]*0.5
+                            + (err-prev_err)*live["D"])
+            live["prev_err"] = err
+            
+            live["curr_index"] += (err_0 <= 50.)
+            stop_flag = live["curr_index"] == self.num_way_points[live["path_id"]]
+            if profiler is not None:
+                profiler.terminate("path_end", np.sum(stop_flag))
+                profiler.lap("get_vels")
+            if stop_flag.any():
+                completed[live["ids"][stop_flag]] = True
+                live = terminate(live, stop_flag, step)
+                if not live["ids"].size: break
+            
+            '''
+            Event Triggering mask: rows whose weighed
+            change in input crosses their own threshold
+            receive the new input, the rest keep
+            the previous one
+            
+            '''
+            
+            curr_state, dir, err = live["curr_state"], live["dir"], live["prev_err"]
+            prev_pos = np.copy(curr_state[:, :2])
+            del_vels = live["vels"] - live["prev_vels"]
+            trigger = quad_form(del_vels, self.Q) >= live["thresh"]
+            prev_vels = np.where(trigger[:, None], live["vels"], live["prev_vels"])
+            live["prev_vels"] = prev_vels
+            live["count_with_etc"] += trigger
+            if profiler is not None:
+                profiler.steps += trigger.shape[0]
+                profiler.fired += np.sum(trigger)
+                profiler.lap("trigger")
+            
+            curr_state[:, :2] += (prev_vels[:, 0]*self.dt)[:, None]*dir
+            curr_state[:, -1] += prev_vels[:, 1]*self.dt
+            live["dir"] = np.stack((np.cos(curr_state[:, -1]), np.sin(curr_state[:, -1])), axis=1)
+            curr_state[np.abs(curr_state[:, -1]) >= np.pi, -1] *= -1
+            if profiler is not None:
+                profiler.lap("step_sim")
+            
+            curr_error = quad_form(err, self.Q_)
+            stop_flag = (curr_error > 1e2) | (step > self.max_iter)
+            if profiler is not None:
+                profiler.terminate("error", np.sum(curr_error > 1e2))
+                profiler.terminate("max_iter", np.sum(stop_flag) - np.sum(curr_error > 1e2))
+            
+            # Distance is accumulated from the second step on, like TrajectoryRecorder
+            if step:
+                live["dist_covered"] += norm_2d(curr_state[:, :2] - prev_pos)
+            live["avg_error"] += curr_error*self.dt
+            step += 1
+            
+            if stop_flag.any():
+                live = terminate(live, stop_flag, step)
+            
+            if self.early_abort:
+                bound = score_bound(step, live["count_with_etc"], live["avg_error"], live["curr_index"],
+                                    self.num_way_points[live["path_id"]], self.max_count, self.far_gain)
+                abort_flag = bound <= live["abort_level"]
+                if abort_flag.any():
+                    live = terminate(live, abort_flag, step, aborted=True)
+                if profiler is not None:
+                    profiler.terminate("aborted", np.sum(abort_flag))
+            if profiler is not None:
+                profiler.lap("bookkeeping")
+        
+        '''
+        Scores are calculated exactly as in
+        ETC_PSO_Member.eval for every particle
+        
+        '''
+        
+        traj_diff = dist_covered - self.path_dist[path_id]
+        
+        scores = (1e3 + (count_with_ttc - count_with_etc)*0.35
+                  - (np.abs(traj_diff))*0.65 - avg_error)
+        bound = score_bound(count_with_ttc, count_with_etc, avg_error, curr_index,
+                            self.num_way_points[path_id], self.max_count, self.far_gain)
+        scores[self.aborted] = bound[self.aborted]
+        
+        self.rollout_stats = {"count_with_etc": count_with_etc,
+                              "count_with_ttc": count_with_ttc,
+                              "avg_error": avg_error,
+                              "length_error": np.abs(traj_diff),
+                              "completed": completed}
+        self.path_scores = scores.reshape(num_particles, self.num_paths)
+        self.aborted = self.aborted.reshape(num_particles, self.num_paths)[:, 0]
+        return self.aggregate_scores(self.path_scores)
+        
+        
+############################################################################################
+############################################################################################
@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .bot_sim import ETC_PSO_Batch
+from .path_geometry import as_geometry
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+One chunk of paths: the ETC controller and its
+time triggered baseline (same P, I, D with a
+threshold of 0, so every step triggers) are
+simulated on all the paths at once by the
+batch simulator; runs in a pool worker too
+
+'''
+
+def _eval_paths(paths, vars, dt, max_iter, Q_err, Q_ETC):
+    batch = ETC_PSO_Batch(as_geometry([np.asarray(path) for path in paths]), dt, max_iter, Q_err, Q_ETC)
+    batch.eval(vars)
+    return {key: val.reshape(vars.shape[0], len(paths)) for key, val in batch.rollout_stats.items()}
+
+
+def bootstrap_ci(samples, confidence=0.95, num_resamples=2000, seed=0, chunk_size=100):
+    '''
+    Percentile bootstrap interval of the mean; it
+    stays within the range of the samples, so bounded
+    & skewed metrics (rates, completion) get sensible
+    intervals; resampled chunk_size at a time
+
+    '''
+
+    rng = np.random.default_rng(seed)
+    means = np.concatenate([np.mean(samples[rng.integers(0, samples.size, (min(chunk_size, num_resamples - start), samples.size))], axis=1)
+                            for start in range(0, num_resamples, chunk_size)])
+    return np.quantile(means, [0.5 - confidence/2, 0.5 + confidence/2])
+
+
+def summarize(samples, confidence=0.95):
+    '''
+    Mean with its confidence interval (percentile
+    bootstrap), std & percentiles of the per path
+    samples of one metric
+
+    '''
+
+    samples = np.asarray(samples, dtype=float)
+    mean = np.mean(samples)
+    std = np.std(samples, ddof=1) if samples.size > 1 else 0.
+    ci = bootstrap_ci(samples, confidence)
+    percentiles = np.percentile(samples, [5, 25, 50, 75, 95])
+    return {"mean": float(mean),
+            "ci": [float(ci[0]), float(ci[1])],
+            "std": float(std),
+            "percentiles": {str(level): float(val) for level, val in zip((5, 25, 50, 75, 95), percentiles)}}
+
+
+############################################################################################
+############################################################################################
+
+
+class ETCEvaluation():
+    '''
+    Monte Carlo comparison of a trained controller
+    (P, I, D & ETC thresh) with its time triggered
+    baseline over a large number of paths, which are
+    simulated chunk_size at a time by the batch
+    simulator, in a process pool if executor is
+    "process" (num_workers: all cores if None)
+
+    Metrics per path:
+    trigger_reduction -> 1 - ETC triggers / steps of the same
+                         ETC rollout (TTC triggers every step)
+    tracking_error -> Integrated weighed error (avg_error of the score)
+    length_error -> |distance travelled - path length|
+    completed -> 1 if the last waypoint was reached
+
+    '''
+
+    def __init__(self, dt, max_iter, Q_err, Q_ETC, chunk_size=100, executor=None, num_workers=None, **kwargs):
+        self.sys_params = {"dt": dt, "max_iter": max_iter, "Q_err": Q_err, "Q_ETC": Q_ETC}
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self.num_workers = num_workers
+
+
+    def run(self, P, I, D, thresh, paths, verbose=True):
+        '''
+        Per path samples of every metric for ETC
+        and TTC, in the order of the paths
+
+        '''
+
+        vars = np.array([np.concatenate((P, I, D, [thresh])),
+                         np.concatenate((P, I, D, [0.]))])
+        chunks = [paths[start:start + self.chunk_size] for start in range(0, len(paths), self.chunk_size)]
+        results = [None]*len(chunks)
+        progress = tqdm(total=len(chunks), disable=not verbose)
+
+        if self.executor == "process":
+            with ProcessPoolExecutor(max_workers=self.num_workers or os.cpu_count()) as pool:
+                tasks = {pool.submit(_eval_paths, [np.asarray(path) for path in chunk], vars, **self.sys_params): index
+                         for index, chunk in enumerate(chunks)}
+                for task in as_completed(tasks):
+                    results[tasks[task]] = task.result()
+                    progress.update()
+        else:
+            for index, chunk in enumerate(chunks):
+                results[index] = _eval_paths(chunk, vars, **self.sys_params)
+                progress.update()
+        progress.close()
+
+        stats = {key: np.concatenate([result[key] for result in results], axis=1) for key in results[0]}
+        # Both counts come from the same rollout, as in the pygame simulation
+        samples = {"trigger_reduction": 1 - stats["count_with_etc"][0]/stats["count_with_ttc"][0]}
+        for index, mode in enumerate(("etc", "ttc")):
+            samples[f"{mode}_triggers"] = stats["count_with_etc"][index]
+            samples[f"{mode}_steps"] = stats["count_with_ttc"][index]
+            samples[f"{mode}_tracking_error"] = stats["avg_error"][index]
+            samples[f"{mode}_length_error"] = stats["length_error"][index]
+            samples[f"{mode}_completed"] = stats["completed"][index].astype(float)
+        return samples
+
+
+    @staticmethod
+    def report(samples, confidence=0.95):
+        return {"num_paths": int(samples["trigger_reduction"].shape[0]),
+                "confidence": confidence,
+                "metrics": {name: summarize(vals, confidence) for name, vals in samples.items()}}
+
+
+    @staticmethod
+    def save(folder, samples, confidence=0.95):
+        '''
+        EVALUATION.json with the summaries and
+        EVALUATION.npz with the per path samples
+
+        '''
+
+        os.makedirs(folder, exist_ok=True)
+        report = ETCEvaluation.report(samples, confidence)
+        with open(os.path.join(folder, "EVALUATION.json"), "w") as curr_file:
+            json.dump(report, curr_file, indent=2)
+        np.savez_compressed(os.path.join(folder, "EVALUATION.npz"), **samples)
+        return report
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,55 @@
+import numpy as np
+from .path_geometry import as_geometry
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Levels of a fidelity schedule are dicts of:
+
+dt_scale -> dt is this many times coarser, with max_iter
+            cut by the same factor so that the same time
+            is simulated
+horizon -> Fraction of that time which is simulated, on
+           the same fraction of the path (by length), so
+           that rollouts are scored against the part of
+           the path they can reach
+path_stride -> Paths keep only every Nth waypoint
+iterations -> The level ends after this many iterations
+spread -> The level ends once the spread of the swarm (max
+          std of a variable / range_var) falls below it
+
+Missing entries leave that part at full fidelity (or
+never end the level); after the last level the swarm
+is trained at full fidelity
+
+'''
+
+def fidelity_params(sys_params, dt_scale=1, horizon=1., path_stride=1, **kwargs):
+    '''
+    System params of one level of the schedule,
+    derived from the full fidelity ones
+
+    '''
+
+    params = dict(sys_params)
+    params["dt"] = sys_params["dt"]*dt_scale
+    params["max_iter"] = sys_params["max_iter"]*horizon/dt_scale
+
+    path = as_geometry(sys_params["path"])
+    if isinstance(path, list):
+        params["path"] = [curr_path.truncate(horizon).decimate(path_stride) for curr_path in path]
+    else:
+        params["path"] = path.truncate(horizon).decimate(path_stride)
+    return params
+
+
+def level_done(level, iterations, spread):
+    return (iterations >= level.get("iterations", np.inf)
+            or spread < level.get("spread", 0.))
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,86 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+
+############################################################################################
+############################################################################################
+
+
+class FitnessCache():
+    '''
+    Bounded LRU cache for the scores of
+    ETC_PSO_Member.eval, keyed on the design
+    variables (quantized to a resolution) and
+    a hash of the path (or bank of paths) &
+    simulation params
+
+    max_size -> Max number of scores kept
+    resolution -> Step used for quantizing the design
+                  variables (scalar or one per variable),
+                  None keys on the exact values
+
+    '''
+
+    def __init__(self, max_size=4096, resolution=None):
+        self.hits = 0
+        self.misses = 0
+        self.max_size = max_size
+        self.resolution = resolution
+        self.scores = OrderedDict()
+
+
+    def context(self, path, dt, max_iter, Q_err, Q_ETC, aggregate="mean"):
+        '''
+        Hash of everything apart from the design
+        variables that decides the score
+
+        '''
+
+        paths = list(path) if isinstance(path, (list, tuple)) else [path]
+        paths = [getattr(curr_path, "way_points", curr_path) for curr_path in paths]
+        digest = hashlib.sha1(str(aggregate).encode())
+        for arr in (*paths, Q_err, Q_ETC, dt, max_iter):
+            digest.update(str(np.shape(arr)).encode())
+            digest.update(np.ascontiguousarray(arr, dtype=float).tobytes())
+        return digest.hexdigest()
+
+
+    def key(self, context, vars):
+        if self.resolution is None:
+            return context, np.asarray(vars, dtype=float).tobytes()
+        return context, tuple(np.round(vars/self.resolution).astype(np.int64).tolist())
+
+
+    def get(self, key):
+        score = self.scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.scores.move_to_end(key)
+        return score
+
+
+    def put(self, key, score):
+        self.scores[key] = score
+        self.scores.move_to_end(key)
+        if len(self.scores) > self.max_size:
+            self.scores.popitem(last=False)
+
+
+    def stats(self):
+        '''
+        Hits are the rollouts saved by the cache
+
+        '''
+
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.scores),
+                "hit_rate": self.hits/total if total else 0.}
+
+
+############################################################################################
+############################################################################################
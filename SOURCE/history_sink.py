@@ -0,0 +1,102 @@
+import os
+import numpy as np
+
+
+############################################################################################
+############################################################################################
+
+
+class HistorySink():
+    '''
+    Preallocated storage for the training history,
+    written one iteration at a time; with a folder
+    the arrays are memory-mapped .npy files there
+    (vars_history, scores_history, best_scores_history,
+    time_history) which are read lazily, page by page, by the
+    plots; otherwise they are kept in memory
+
+    step -> Only every step-th iteration of vars_history
+            & scores_history is kept (downsampling for
+            very long runs); best_scores_history &
+            time_history (seconds since the start of
+            training) are kept for every iteration
+
+    '''
+
+    def __init__(self, num_iter, num_bots, num_vars=7, folder=None, step=1):
+        self.step = step
+        self.count = 0
+        self.folder = folder
+        num_rows = -(-num_iter//step)
+        shapes = {"vars_history": (num_rows, num_bots, num_vars),
+                  "scores_history": (num_rows, num_bots),
+                  "best_scores_history": (num_iter,),
+                  "time_history": (num_iter,)}
+
+        self.arrays = {}
+        for name, shape in shapes.items():
+            if folder is None:
+                self.arrays[name] = np.zeros(shape)
+            else:
+                os.makedirs(folder, exist_ok=True)
+                self.arrays[name] = np.lib.format.open_memmap(os.path.join(folder, f"{name}.npy"),
+                                                              mode="w+", dtype=np.float64, shape=shape)
+
+
+    def append(self, scores, vars, best_score, elapsed=0.):
+        if self.count % self.step == 0:
+            row = self.count//self.step
+            self.arrays["vars_history"][row] = vars
+            self.arrays["scores_history"][row] = scores
+        self.arrays["best_scores_history"][self.count] = best_score
+        self.arrays["time_history"][self.count] = elapsed
+        self.count += 1
+
+
+    def elapsed(self):
+        return self.arrays["time_history"][self.count-1] if self.count else 0.
+
+
+    def __getstate__(self):
+        '''
+        When pickled (e.g. in a checkpoint) a memory-mapped
+        history is flushed and only its file names are
+        kept; it is reopened from them when unpickled
+        
+        '''
+        
+        state = dict(self.__dict__)
+        if self.folder is not None:
+            self.flush()
+            state["arrays"] = list(self.arrays)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.folder is not None:
+            self.arrays = {name: np.load(os.path.join(self.folder, f"{name}.npy"), mmap_mode="r+")
+                           for name in state["arrays"]}
+
+
+    def flush(self):
+        if self.folder is not None:
+            for arr in self.arrays.values():
+                arr.flush()
+
+
+    def history(self):
+        '''
+        Views of the iterations written so far
+
+        '''
+
+        num_rows = -(-self.count//self.step)
+        return {"vars_history": self.arrays["vars_history"][:num_rows],
+                "scores_history": self.arrays["scores_history"][:num_rows],
+                "best_scores_history": self.arrays["best_scores_history"][:self.count],
+                "time_history": self.arrays["time_history"][:self.count]}
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,193 @@
+import time
+import numpy as np
+import multiprocessing
+from tqdm import tqdm
+from .pso_algo import PSO, final_eval
+from .history_sink import HistorySink
+from .rollout_profiler import merge_snapshots
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Process side of an island: the swarm lives in
+its own process and follows the commands sent
+through the pipe until it is told to stop; every
+"train" command only runs the iterations, so an
+island trained in epochs matches a single run
+
+'''
+
+def _run_island(conn, num_bots, pso_args, sys_params, learning_rates, num_migrants):
+    pso = PSO(num_bots, **pso_args, **sys_params)
+    while True:
+        command, args = conn.recv()
+        
+        if command == "train":
+            start = pso.iteration
+            history = HistorySink(args - pso.iteration, num_bots)
+            pso.train(args, learning_rates, history, verbose=False, finalize=False)
+            summary = {"global_best": pso.global_best,
+                       "best_score": pso.best_score,
+                       "profile": pso.profile_history[start:]}
+            conn.send(({key: np.array(val) for key, val in history.history().items()},
+                       pso.migrants(num_migrants), summary))
+        
+        elif command == "migrate":
+            pso.accept_migrants(*args)
+        
+        elif command == "stop":
+            conn.send({"cache_stats": pso.cache.stats() if pso.cache is not None else None,
+                       "num_aborted": int(pso.num_aborted)})
+            conn.close()
+            return
+
+
+############################################################################################
+############################################################################################
+
+
+class IslandPSO():
+    '''
+    Island model PSO: num_islands independent swarms
+    of num_bots members each run in their own process
+    and every migration_every iterations send copies
+    of their num_migrants best members to the islands
+    given by the topology, where they replace the
+    worst members
+    
+    topology -> "ring": island i sends to island i+1
+                "all": every island sends to all others
+                or a list with the receiving islands
+                of every island
+    
+    The history of the islands is put side by side
+    (num_islands*num_bots members) so that it can be
+    plotted like the one of a single swarm; with
+    profile the rollout profiles of all the islands
+    are merged per iteration; the global best of
+    the best island is re-evaluated once at the end
+    
+    '''
+    
+    def __init__(self, num_bots, num_islands=4, migration_every=5, num_migrants=2, topology="ring",
+                 eval_mode="serial", seed=None, update_mode="sync", profile=False, **sys_params) -> None:
+        self.profile = profile
+        self.num_islands = num_islands
+        self.bots_per_island = num_bots
+        self.num_bots = num_islands*num_bots
+        self.num_migrants = num_migrants
+        self.migration_every = migration_every
+        self.sys_params = sys_params
+        
+        if topology == "ring":
+            self.receivers = [[(index + 1) % num_islands] for index in range(num_islands)]
+        elif topology == "all":
+            self.receivers = [[other for other in range(num_islands) if other != index]
+                              for index in range(num_islands)]
+        else:
+            self.receivers = [list(receivers) for receivers in topology]
+        
+        # Islands are seeded from independent streams & always evaluate in their own process
+        seeds = np.random.SeedSequence(seed).generate_state(num_islands).tolist()
+        self.pso_args = [{"eval_mode": eval_mode, "executor": None, "seed": curr_seed,
+                          "update_mode": update_mode, "profile": profile} for curr_seed in seeds]
+    
+    
+    def migrate(self, conns, migrants):
+        incoming = [[] for _ in range(self.num_islands)]
+        for index, receivers in enumerate(self.receivers):
+            for receiver in receivers:
+                incoming[receiver].append(migrants[index])
+        
+        for conn, curr_migrants in zip(conns, incoming):
+            if curr_migrants:
+                conn.send(("migrate", (np.concatenate([vars for vars, _ in curr_migrants]),
+                                       np.concatenate([scores for _, scores in curr_migrants]))))
+    
+    
+    def train(self, num_iter, learning_rates, history=None):
+        '''
+        The islands are trained migration_every
+        iterations at a time, their histories are
+        combined and then the migrants are exchanged
+        
+        '''
+        
+        if history is None:
+            history = HistorySink(num_iter, self.num_bots)
+        
+        profile_history = []
+        conns = []
+        processes = []
+        for pso_args in self.pso_args:
+            conn, island_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_island,
+                                              args=(island_conn, self.bots_per_island, pso_args, self.sys_params,
+                                                    learning_rates, self.num_migrants))
+            process.start()
+            conns.append(conn)
+            processes.append(process)
+        
+        start = time.perf_counter()
+        try:
+            for epoch_end in tqdm(range(self.migration_every, num_iter + self.migration_every, self.migration_every)):
+                epoch_end = min(epoch_end, num_iter)
+                for conn in conns:
+                    conn.send(("train", epoch_end))
+                results = [conn.recv() for conn in conns]
+                elapsed = time.perf_counter() - start
+                
+                histories = [curr_history for curr_history, _, _ in results]
+                for row in range(histories[0]["best_scores_history"].shape[0]):
+                    history.append(np.concatenate([curr_history["scores_history"][row] for curr_history in histories]),
+                                   np.concatenate([curr_history["vars_history"][row] for curr_history in histories]),
+                                   max(curr_history["best_scores_history"][row] for curr_history in histories),
+                                   elapsed)
+                
+                if self.profile:
+                    profiles = [summary["profile"] for _, _, summary in results]
+                    profile_history += [merge_snapshots(snapshots).snapshot() for snapshots in zip(*profiles)]
+                
+                if epoch_end < num_iter:
+                    self.migrate(conns, [migrants for _, migrants, _ in results])
+            
+            for conn in conns:
+                conn.send(("stop", None))
+            finals = [conn.recv() for conn in conns]
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            history.flush()
+        
+        # Final solution is the global best of the best island,
+        # re-evaluated once here on a scratch member
+        summaries = [summary for _, _, summary in results]
+        best = max(summaries, key=lambda summary: summary["best_score"])
+        bot, score = final_eval(self.sys_params, best["global_best"])
+        output_dict = {"P": bot.P,
+                       "I": bot.I,
+                       "D": bot.D,
+                       "max_score": score,
+                       "thresh": bot.thresh,
+                       **history.history()}
+        if self.profile:
+            output_dict["profile"] = profile_history
+        if finals[0]["cache_stats"] is not None:
+            hits = sum(final["cache_stats"]["hits"] for final in finals)
+            misses = sum(final["cache_stats"]["misses"] for final in finals)
+            output_dict["cache_stats"] = {"hits": hits,
+                                          "misses": misses,
+                                          "size": sum(final["cache_stats"]["size"] for final in finals),
+                                          "hit_rate": hits/(hits + misses) if hits + misses else 0.}
+        if self.sys_params.get("early_abort"):
+            output_dict["aborted_rollouts"] = sum(final["num_aborted"] for final in finals)
+        return output_dict
+
+
+############################################################################################
+############################################################################################
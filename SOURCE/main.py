@@ -1,7 +1,16 @@
+import os
 from .utilities import *
 from .pso_algo import PSO
+from .island_pso import IslandPSO
 from .bot_sim import ETC_PSO_Member
+from .fitness_cache import FitnessCache
+from .path_bank import PathBank
+from .path_geometry import PathGeometry
+from .history_sink import HistorySink
+from .surrogate import RBFSurrogate
+from .rollout_profiler import save_profile
 from .pygame_handler import GameHandler
+from .etc_evaluation import ETCEvaluation
 
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
@@ -11,69 +20,44 @@ from matplotlib.animation import FuncAnimation
 ############################################################################################
 
 
-def RUN(file_path):
+def resample_paths(paths):
     '''
-    FINAL RUN FUNTION FOR
-    GENERATING PATHS,
-    TRAINING PSO,
-    SIMULATING BOT,
-    PLOTTING AND SAVING RESULTS
-    ALL-IN-ONE!
+    Paths resampled by arc length as set
+    in path_params (unchanged by default)
     
-    '''
+    A rollout moves on to the next waypoint within
+    50 of the current one and stops once the error
+    exceeds 1e2 under Q_err (100 px by default), so
+    waypoints may be at most half of the gap between
+    these two radii apart; it also takes at least
+    one step per waypoint, so there must be fewer
+    waypoints than max_iter
     
-    plt.style.use("dark_background")
-
-    path = get_path(random_flag=1)
-    etc_pso_params["path"] = path
-    print("\nNew Path Assigned Successfully...")
-    print(f"Number of Waypoints: {path.shape[0]}")
-    
-    
-############################################################################################
-############################################################################################
-
     '''
-    Simulation with initial Guess
-    
-    '''
-    
-    bot = ETC_PSO_Member(**etc_pso_params)
-    bot.vars = etc_pso_params["init_guess"]
-    score = bot.eval()
-    
-    print("\nInitial Guess...")
-    print(f"P: {np.round(bot.P, 3)}")
-    print(f"I: {np.round(bot.I, 3)}")
-    print(f"D: {np.round(bot.D, 3)}")
-    print(f"ETC Thresh: {bot.thresh}")
-    print(f"Score on current path with initial Guess: {np.round(score, 3)}")
     
+    if path_params["spacing"] is None and path_params["num_points"] is None and not path_params["spline"]:
+        return paths
+    paths = [curr_path.resample(**path_params) for curr_path in paths]
+    
+    max_spacing = (np.sqrt(1e2/etc_pso_params["Q_err"][0, 0]) - 50.)/2
+    for curr_path in paths:
+        spacing = curr_path.length/(curr_path.num_way_points-1)
+        if spacing > max_spacing:
+            raise ValueError(f"Resampled waypoints are {spacing:.1f} apart, rollouts cannot follow more than {max_spacing:.1f}")
+        if curr_path.num_way_points >= etc_pso_params["max_iter"]:
+            raise ValueError(f"Resampled paths have {curr_path.num_way_points} waypoints, rollouts end after max_iter = {etc_pso_params['max_iter']:g} steps")
+    return paths
 
-############################################################################################
-############################################################################################
 
+def PLOT_TRAINING(file_path, output, bot, num_bots):
     '''
-    PSO Training
+    PLOTTING AND SAVING THE
+    TRAINING RESULTS: SCORES,
+    WEIGHT ANIMATIONS AND
+    EVOLUTION OF WEIGHTS
     
     '''
     
-    print("\nInitialising PSO training...\n")
-    pso = PSO(pso_params["num_bots"], **etc_pso_params)
-    output = pso.train(pso_params["num_steps"], pso_params["learning_rate"])
-    
-    print("\nTrained Weights...")
-    print(f"P: {np.round(output['P'], 3)}")
-    print(f"I: {np.round(output['I'], 3)}")
-    print(f"D: {np.round(output['D'], 3)}")
-    print(f"ETC Thresh: {np.round(output['thresh'], 3)}")
-    print(f"Max Score on current path after training: {np.round(output['max_score'], 3)}")
-    print("Generating Plots on training results... Please Wait")
-
-    
-############################################################################################
-############################################################################################
-
     '''
     Ploting Evolution of scores
     
@@ -118,10 +102,10 @@ def RUN(file_path):
               "x_label": "P (for Linear Velocity)",
               "y_label": "P (for Angular Velocity)",
               "title": f"EVOLUTION OF WEIGHTS (P); \nGreen Dot: Final Soln; Red Dot: Initial Guess",
-              "data": np.array([output["vars_history"][:, k, 0:2] for k in range(pso.num_bots)])
+              "data": np.array([output["vars_history"][:, k, 0:2] for k in range(num_bots)])
               }
     anim = animate(**params)
-    final = FuncAnimation(fig=fig, func=anim.update, frames = range(1, pso_params["num_steps"]), interval=100)
+    final = FuncAnimation(fig=fig, func=anim.update, init_func=anim.init, frames = range(1, output["vars_history"].shape[0]), interval=100, blit=True)
     final.save(f"{file_path}\EVOLUTION OF WEIGHTS (P).gif")
     print("Saving Animation for P"); plt.close()
     
@@ -132,10 +116,10 @@ def RUN(file_path):
               "x_label": "I (for Linear Velocity)",
               "y_label": "I (for Angular Velocity)",
               "title": f"EVOLUTION OF WEIGHTS (I); \nGreen Dot: Final Soln; Red Dot: Initial Guess",
-              "data": np.array([output["vars_history"][:, k, 2:4] for k in range(pso.num_bots)])
+              "data": np.array([output["vars_history"][:, k, 2:4] for k in range(num_bots)])
               }
     anim.load(**params)
-    final = FuncAnimation(fig=fig, func=anim.update, frames = range(1, pso_params["num_steps"]), interval=100)
+    final = FuncAnimation(fig=fig, func=anim.update, init_func=anim.init, frames = range(1, output["vars_history"].shape[0]), interval=100, blit=True)
     final.save(f"{file_path}\EVOLUTION OF WEIGHTS (I).gif")
     print("Saving Animation for I"); plt.close()
     
@@ -146,10 +130,10 @@ def RUN(file_path):
               "x_label": "D (for Linear Velocity)",
               "y_label": "D (for Angular Velocity)",
               "title": f"EVOLUTION OF WEIGHTS (D); \nGreen Dot: Final Soln; Red Dot: Initial Guess",
-              "data": np.array([output["vars_history"][:, k, 4:6] for k in range(pso.num_bots)])
+              "data": np.array([output["vars_history"][:, k, 4:6] for k in range(num_bots)])
               }
     anim.load(**params)
-    final = FuncAnimation(fig=fig, func=anim.update, frames = range(1, pso_params["num_steps"]), interval=100)
+    final = FuncAnimation(fig=fig, func=anim.update, init_func=anim.init, frames = range(1, output["vars_history"].shape[0]), interval=100, blit=True)
     final.save(f"{file_path}\EVOLUTION OF WEIGHTS (D).gif")
     print("Saving Animation for D"); plt.close()
 
@@ -160,10 +144,10 @@ def RUN(file_path):
               "x_label": "Training Iteration",
               "y_label": "Event Triggering Threshold",
               "title": f"EVOLUTION OF WEIGHTS (thresh); \nGreen Line: Final Soln; Red Line: Initial Guess",
-              "data": np.array([output["vars_history"][:, k, -1] for k in range(pso.num_bots)])
+              "data": np.array([output["vars_history"][:, k, -1] for k in range(num_bots)])
               }
     anim.load(**params)
-    final = FuncAnimation(fig=fig, func=anim.update, frames = range(1, pso_params["num_steps"]), interval=100)
+    final = FuncAnimation(fig=fig, func=anim.update, init_func=anim.init, frames = range(1, output["vars_history"].shape[0]), interval=100, blit=True)
     final.save(f"{file_path}\EVOLUTION OF WEIGHTS (thresh).gif")
     print("Saving Animation for Thresh"); plt.close()
     
@@ -184,7 +168,7 @@ def RUN(file_path):
               "x_label": "P (for Linear Velocity)",
               "y_label": "P (for Angular Velocity)",
               "title": f"Proportional Coeff (P)",
-              "vals": [output["vars_history"][:, k, 0:2] for k in range(pso.num_bots)],
+              "vals": [output["vars_history"][:, k, 0:2] for k in range(num_bots)],
               "legends": []                          
             }
     ax[i][j].scatter(output['P'][0], output['P'][1], color="green")
@@ -196,7 +180,7 @@ def RUN(file_path):
               "x_label": "I (for Linear Velocity)",
               "y_label": "I (for Angular Velocity)",
               "title": f"Integral Coeff (I)",
-              "vals": [output["vars_history"][:, k, 2:4] for k in range(pso.num_bots)],
+              "vals": [output["vars_history"][:, k, 2:4] for k in range(num_bots)],
               "legends": []                          
             }
     ax[i][j].scatter(output['I'][0], output['I'][1], color="green")
@@ -208,7 +192,7 @@ def RUN(file_path):
               "x_label": "D (for Linear Velocity)",
               "y_label": "D (for Angular Velocity)",
               "title": f"Differential Coeff (D)",
-              "vals": [output["vars_history"][:, k, 4:6] for k in range(pso.num_bots)],
+              "vals": [output["vars_history"][:, k, 4:6] for k in range(num_bots)],
               "legends": []
             }
     ax[i][j].scatter(output['D'][0], output['D'][1], color="green")
@@ -220,7 +204,7 @@ def RUN(file_path):
               "x_label": "Training Iteration",
               "y_label": "Event Triggering Threshold",
               "title": f"Event Triggering Threshold (thresh)",
-              "vals": [output["vars_history"][:, k, -1] for k in range(pso.num_bots)],
+              "vals": [output["vars_history"][:, k, -1] for k in range(num_bots)],
               "legends": []
             }
     ax[i][j].axhline(y=output['thresh'], alpha=0.5, color="green", linestyle="dashed")
@@ -232,7 +216,180 @@ def RUN(file_path):
     plt.savefig(f"{file_path}\EVOLUTION OF WEIGHTS.png", dpi=300)
     plt.show()
     print("Plots generated successfully...")
-    del pso, bot, anim
+
+
+############################################################################################
+############################################################################################
+
+
+def RUN(file_path, resume=False):
+    '''
+    FINAL RUN FUNTION FOR
+    GENERATING PATHS,
+    TRAINING PSO,
+    SIMULATING BOT,
+    PLOTTING AND SAVING RESULTS
+    ALL-IN-ONE!
+    
+    With resume, the training of the run
+    in file_path continues from its
+    last checkpoint
+    
+    '''
+    
+    plt.style.use("dark_background")
+    checkpoint_file = os.path.join(file_path, "CHECKPOINT.pkl")
+    
+    if resume:
+        pso, history = PSO.load_checkpoint(checkpoint_file)
+        paths = pso.sys_params["path"]
+        paths = paths if isinstance(paths, list) else [paths]
+        path = paths[0]
+        etc_pso_params["path"] = pso.sys_params["path"]
+        etc_pso_params["cache"] = pso.cache
+        print(f"\nResuming training from iteration {pso.iteration}...")
+        print(f"Number of Waypoints: {[curr_path.num_way_points for curr_path in paths]}")
+    
+    else:
+        # Training is done on a bank of paths if num_paths > 1;
+        # the first one is used for the plots & the simulation.
+        # Generated paths are kept on disk next to the run folders
+        # and their geometry is shared by every simulator;
+        # paths are scaled to the simulation window and
+        # can be resampled evenly along their arc length
+        bank = PathBank(os.path.join(os.path.dirname(file_path), "PATH_BANK"))
+        paths = bank.draw(pso_params["num_paths"], pso_params["seed"], game_params["x_screen"], game_params["y_screen"])
+        paths = resample_paths([PathGeometry(curr_path) for curr_path in paths])
+        path = paths[0]
+        etc_pso_params["path"] = paths if len(paths) > 1 else path
+        etc_pso_params["cache"] = FitnessCache(**cache_params)
+        print("\nNew Path Assigned Successfully...")
+        print(f"Number of Waypoints: {[curr_path.num_way_points for curr_path in paths]}")
+    
+    
+############################################################################################
+############################################################################################
+
+    '''
+    Simulation with initial Guess
+    
+    '''
+    
+    bot = ETC_PSO_Member(**etc_pso_params)
+    bot.vars = etc_pso_params["init_guess"]
+    score = bot.eval()
+    
+    print("\nInitial Guess...")
+    print(f"P: {np.round(bot.P, 3)}")
+    print(f"I: {np.round(bot.I, 3)}")
+    print(f"D: {np.round(bot.D, 3)}")
+    print(f"ETC Thresh: {bot.thresh}")
+    print(f"Score on current path with initial Guess: {np.round(score, 3)}")
+    
+
+############################################################################################
+############################################################################################
+
+    '''
+    PSO Training
+    
+    '''
+    
+    if not resume:
+        print("\nInitialising PSO training...\n")
+        if pso_params["num_islands"] > 1:
+            pso = IslandPSO(pso_params["num_bots"],
+                            num_islands=pso_params["num_islands"],
+                            migration_every=pso_params["migration_every"],
+                            num_migrants=pso_params["num_migrants"],
+                            topology=pso_params["topology"],
+                            eval_mode=pso_params["eval_mode"],
+                            seed=pso_params["seed"],
+                            update_mode=pso_params["update_mode"],
+                            profile=pso_params["profile"],
+                            **etc_pso_params)
+        else:
+            pso = PSO(pso_params["num_bots"],
+                      eval_mode=pso_params["eval_mode"],
+                      executor=pso_params["executor"],
+                      num_workers=pso_params["num_workers"],
+                      seed=pso_params["seed"],
+                      update_mode=pso_params["update_mode"],
+                      profile=pso_params["profile"],
+                      surrogate=RBFSurrogate(etc_pso_params["range_var"], **surrogate_params) if pso_params["surrogate"] else None,
+                      **etc_pso_params)
+        # The history is streamed to memory-mapped files in the output folder
+        # and only read (page by page) when plotting
+        history = HistorySink(pso_params["num_steps"], pso.num_bots,
+                              folder=os.path.join(file_path, "HISTORY"),
+                              step=pso_params["history_step"])
+    
+    # Islands live in their own processes and are neither
+    # checkpointed nor stopped early
+    if isinstance(pso, IslandPSO):
+        output = pso.train(pso_params["num_steps"], pso_params["learning_rate"], history)
+    else:
+        output = pso.train(pso_params["num_steps"], pso_params["learning_rate"], history,
+                           checkpoint_file=checkpoint_file,
+                           checkpoint_every=pso_params["checkpoint_every"],
+                           patience=pso_params["patience"],
+                           spread_tol=pso_params["spread_tol"],
+                           time_budget=pso_params["time_budget"],
+                           eval_budget=pso_params["eval_budget"],
+                           restart_patience=pso_params["restart_patience"],
+                           fidelity_schedule=pso_params["fidelity_schedule"])
+        print(f"\nTraining stopped after {output['stop_iter']} iterations ({output['stop_reason']})")
+        if "surrogate_stats" in output:
+            print(f"Rollouts saved by the surrogate: {output['surrogate_stats']['screened']}")
+        if "fidelity_stats" in output:
+            print(f"Fidelity levels started at iterations: {output['fidelity_stats']['level_starts']} "
+                  f"({output['fidelity_stats']['rescored']} bests re-scored)")
+    
+    print("\nTrained Weights...")
+    print(f"P: {np.round(output['P'], 3)}")
+    print(f"I: {np.round(output['I'], 3)}")
+    print(f"D: {np.round(output['D'], 3)}")
+    print(f"ETC Thresh: {np.round(output['thresh'], 3)}")
+    print(f"Max Score on current path after training: {np.round(output['max_score'], 3)}")
+    print(f"Rollouts saved by the fitness cache: {output['cache_stats']['hits']} "
+          f"(hit rate: {np.round(output['cache_stats']['hit_rate']*100, 2)}%)")
+    print("Generating Plots on training results... Please Wait")
+
+    
+############################################################################################
+############################################################################################
+
+    PLOT_TRAINING(file_path, output, bot, pso.num_bots)
+    del pso, bot
+
+
+############################################################################################
+############################################################################################
+
+    '''
+    Monte Carlo comparison of the
+    trained controller with TTC
+    on many random paths
+    
+    '''
+    
+    if eval_params["num_paths"]:
+        print(f"\nEvaluating ETC against TTC on {eval_params['num_paths']} paths...")
+        bank = PathBank(os.path.join(os.path.dirname(file_path), "PATH_BANK"))
+        eval_paths = bank.draw(eval_params["num_paths"], eval_params["seed"], game_params["x_screen"], game_params["y_screen"])
+        eval_paths = [curr_path.way_points for curr_path in resample_paths([PathGeometry(curr_path) for curr_path in eval_paths])]
+        evaluation = ETCEvaluation(**etc_pso_params,
+                                   chunk_size=eval_params["chunk_size"],
+                                   executor=eval_params["executor"],
+                                   num_workers=eval_params["num_workers"])
+        samples = evaluation.run(output["P"], output["I"], output["D"], output["thresh"], eval_paths)
+        report = ETCEvaluation.save(file_path, samples, eval_params["confidence"])
+        
+        for name in ("trigger_reduction", "etc_tracking_error", "ttc_tracking_error",
+                     "etc_length_error", "ttc_length_error", "etc_completed"):
+            metric = report["metrics"][name]
+            print(f"{name}: {np.round(metric['mean'], 4)} "
+                  f"({int(eval_params['confidence']*100)}% CI: {np.round(metric['ci'], 4)})")
 
 
 ############################################################################################
@@ -246,10 +403,19 @@ def RUN(file_path):
     '''
     
     print("\nGenerating PyGame simulation...")
-    game = GameHandler(**game_params)
+    if game_params["frame_step"] and game_params["frame_folder"] is None:
+        game_params["frame_folder"] = os.path.join(file_path, "FRAMES")
+    game = GameHandler(**game_params, profile=pso_params["profile"])
     game.load_bot(path, output["P"], output["I"], output["D"])
+    training_profile = output.get("profile")
     output = game.simulate(output["thresh"], plot_flag=1)
     game.quit()
+    print(f"Simulation ended by: {output['stop_reason']}")
+    
+    # Rollout profiles of every training iteration & of the simulation
+    if training_profile is not None:
+        save_profile(os.path.join(file_path, "PROFILE.json"), training_profile, game.profiler.snapshot())
+        print("Rollout profile saved to PROFILE.json")
     
     i = 0
     fig, ax = plt.subplots(3, 1, figsize=(15, 7))
@@ -306,13 +472,14 @@ def RUN(file_path):
     i = 0
     fig, ax = plt.subplots(1, 2, figsize=(15, 7), width_ratios=[0.75, 0.25])
     
-    game.path_coord[:, 1] *= -1
+    path_coord = np.copy(path.way_points)
+    path_coord[:, 1] *= -1
     output["bot_traj"][:, 1] *= -1
     params = {"ax": ax[i],
         "x_label": "X coordinate",
         "y_label": "Y coordinate",
         "title": "COMPARISON",
-        "vals": [game.path_coord, output["bot_traj"]],
+        "vals": [path_coord, output["bot_traj"]],
         "legends": ["Actual Path", "Bot's Path"]
         }
     plot_curve(**params)
@@ -0,0 +1,101 @@
+import os
+import json
+import numpy as np
+from .utilities import x_screen, y_screen, get_coord
+
+
+############################################################################################
+############################################################################################
+
+
+class PathBank():
+    '''
+    Persistent store of generated paths, so that
+    the Perlin Noise is evaluated only once per path;
+    every path is appended as float64 (x, y) pairs to
+    paths.bin, which is read memory-mapped, and
+    index.json maps the key
+    (octaves, seeds, x_screen, y_screen, density)
+    to the offset & number of waypoints of the path
+
+    '''
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.data = None
+        self.data_file = os.path.join(folder, "paths.bin")
+        self.index_file = os.path.join(folder, "index.json")
+        os.makedirs(folder, exist_ok=True)
+
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as file:
+                self.index = json.load(file)
+
+
+    @staticmethod
+    def key(octaves, seeds, x_screen, y_screen, density):
+        return json.dumps([int(octaves), [float(seed) for seed in seeds],
+                           float(x_screen), float(y_screen), int(density)])
+
+
+    def load_data(self):
+        '''
+        (Re)mapping paths.bin after it has grown
+
+        '''
+
+        self.data = None
+        if os.path.exists(self.data_file) and os.path.getsize(self.data_file):
+            self.data = np.memmap(self.data_file, dtype=np.float64, mode="r").reshape(-1, 2)
+
+
+    def append(self, key, path):
+        offset = os.path.getsize(self.data_file) // 16 if os.path.exists(self.data_file) else 0
+        with open(self.data_file, "ab") as file:
+            file.write(np.ascontiguousarray(path, dtype=np.float64).tobytes())
+
+        # The index is written after the data and swapped in atomically
+        self.index[key] = [offset, path.shape[0]]
+        with open(self.index_file + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        os.replace(self.index_file + ".tmp", self.index_file)
+        self.data = None
+
+
+    def get(self, octaves, seeds, x_screen=x_screen, y_screen=y_screen, density=None):
+        '''
+        Read-only path for the given key; it is
+        generated and appended to the bank if missing
+
+        '''
+
+        density = octaves*100 if density is None else density
+        key = self.key(octaves, seeds, x_screen, y_screen, density)
+        if key not in self.index:
+            x_coord = get_coord(octaves=octaves, seed=seeds[0], density=density)*x_screen
+            y_coord = get_coord(octaves=octaves, seed=seeds[1], density=density)*y_screen
+            self.append(key, np.dstack((x_coord, y_coord))[0])
+
+        if self.data is None:
+            self.load_data()
+        offset, num_way_points = self.index[key]
+        return self.data[offset:offset+num_way_points]
+
+
+    def draw(self, num_paths, rng=None, x_screen=x_screen, y_screen=y_screen, num_seeds=1000):
+        '''
+        Random paths in the style of get_path(random_flag=1),
+        except that the seeds are integers from 1 to num_seeds
+        so that runs keep hitting paths already in the bank
+        (a zero seed would make the Perlin Noise flat)
+
+        '''
+
+        rng = np.random.default_rng(rng)
+        return [self.get(int(rng.integers(3, 5)), rng.integers(1, num_seeds, 2).tolist(), x_screen, y_screen)
+                for _ in range(num_paths)]
+
+
+############################################################################################
+############################################################################################
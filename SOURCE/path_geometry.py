@@ -0,0 +1,150 @@
+import numpy as np
+
+
+############################################################################################
+############################################################################################
+
+
+def catmull_rom(points, t):
+    '''
+    Uniform Catmull-Rom spline through the points,
+    evaluated at the parameter values t (from 0 at
+    the first point to len(points)-1 at the last,
+    point i sits at t = i); the end points are
+    repeated to close off the first & last segment
+    
+    '''
+    
+    points = np.asarray(points, dtype=float)
+    padded = np.concatenate((points[:1], points, points[-1:]))
+    t = np.clip(np.asarray(t, dtype=float), 0, points.shape[0]-1)
+    index = np.minimum(t.astype(int), points.shape[0]-2)
+    u = (t - index)[..., None]
+    
+    P_0, P_1, P_2, P_3 = padded[index], padded[index+1], padded[index+2], padded[index+3]
+    return 0.5*(2*P_1 + (P_2 - P_0)*u
+                + (2*P_0 - 5*P_1 + 4*P_2 - P_3)*u**2
+                + (3*P_1 - P_0 - 3*P_2 + P_3)*u**3)
+
+
+############################################################################################
+############################################################################################
+
+
+class PathGeometry():
+    '''
+    Read-only description of a path, built once
+    and shared by every Bot that follows it:
+    way_points, segment vectors, cumulative arc
+    length, total length and initial pose
+
+    '''
+
+    def __init__(self, path):
+        self.way_points = np.array(path, dtype=float)
+        self.num_way_points = self.way_points.shape[0]
+        self.segments = np.diff(self.way_points, axis=0)
+        self.segment_lengths = np.linalg.norm(self.segments, axis=1)
+        self.arc_length = np.concatenate(([0.], np.cumsum(self.segment_lengths)))
+
+        # Summed exactly like ETC_PSO_Member.get_dist_covered,
+        # so the scores do not change by a single bit
+        self.length = np.sum(self.segment_lengths)
+
+        self.init_pos = self.way_points[0]
+        self.init_angle = np.arctan2(self.segments[0, 1], self.segments[0, 0])
+
+        # Plain floats for the scalar kernel
+        self.points = self.way_points.tolist()
+
+        for arr in (self.way_points, self.segments, self.segment_lengths, self.arc_length):
+            arr.setflags(write=False)
+    
+    
+    def point_at(self, s):
+        '''
+        Points of the path (polyline through the
+        waypoints) at the arc lengths s, which
+        are clipped to the path
+        
+        '''
+        
+        s = np.clip(np.asarray(s, dtype=float), 0, self.arc_length[-1])
+        index = np.clip(np.searchsorted(self.arc_length, s, side="right") - 1, 0, self.num_way_points-2)
+        frac = (s - self.arc_length[index])/np.maximum(self.segment_lengths[index], 1e-12)
+        return self.way_points[index] + frac[..., None]*self.segments[index]
+    
+    
+    def resample(self, spacing=None, num_points=None, spline=False, samples_per_segment=16):
+        '''
+        Same path with waypoints evenly spaced by arc
+        length, either spacing apart (the last one
+        lands on the end of the path) or num_points
+        of them (as many as now if neither is
+        given); the number of waypoints, and with
+        it the length of a rollout, no longer depends
+        on how densely the path was generated
+        
+        spline -> Follows a Catmull-Rom spline through the
+                  waypoints (sampled samples_per_segment
+                  times per segment) instead of the polyline
+        
+        '''
+        
+        curve = self
+        if spline:
+            t = np.linspace(0, self.num_way_points-1, (self.num_way_points-1)*samples_per_segment + 1)
+            curve = PathGeometry(catmull_rom(self.way_points, t))
+        
+        if num_points is None:
+            num_points = (self.num_way_points if spacing is None
+                          else int(np.ceil(curve.arc_length[-1]/spacing)) + 1)
+        num_points = max(num_points, 2)
+        return PathGeometry(curve.point_at(np.linspace(0, curve.arc_length[-1], num_points)))
+
+
+    def decimate(self, stride):
+        '''
+        Same path with only every stride-th
+        waypoint, the last one always kept
+        
+        '''
+        
+        if stride <= 1:
+            return self
+        index = np.arange(0, self.num_way_points, stride)
+        if index[-1] != self.num_way_points-1:
+            index = np.append(index, self.num_way_points-1)
+        return PathGeometry(self.way_points[index])
+
+
+    def truncate(self, fraction):
+        '''
+        First part of the path, up to the last waypoint
+        within fraction of its length (at least
+        the first segment is kept)
+        
+        '''
+        
+        if fraction >= 1:
+            return self
+        num_points = np.searchsorted(self.arc_length, fraction*self.length, side="right")
+        return PathGeometry(self.way_points[:max(num_points, 2)])
+
+
+def as_geometry(path):
+    '''
+    PathGeometry for a path, or a list of them for
+    a bank of paths; geometries are passed through
+
+    '''
+
+    if isinstance(path, (list, tuple)):
+        return [as_geometry(curr_path) for curr_path in path]
+    if isinstance(path, PathGeometry):
+        return path
+    return PathGeometry(path)
+
+
+############################################################################################
+############################################################################################
@@ -1,6 +1,79 @@
+import os
+import time
+import pickle
 import numpy as np
 from tqdm import tqdm
-from .bot_sim import ETC_PSO_Member
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from .bot_sim import ETC_PSO_Member, ETC_PSO_Batch
+from .path_geometry import as_geometry
+from .fidelity import fidelity_params, level_done
+from .history_sink import HistorySink
+from .swarm_state import SwarmState
+from .rollout_profiler import RolloutProfiler
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Worker side of the process pool: every worker
+builds its own simulator once from the path &
+system params handed to the initializer, so
+only the design variables travel with each task;
+with profiling every chunk also sends back the
+profile of its rollouts
+
+'''
+
+_worker = {}
+
+
+def _init_worker(eval_mode, sys_params, profile=False):
+    _worker["profiler"] = RolloutProfiler() if profile else None
+    _worker["bot"] = ETC_PSO_Member(**sys_params, profiler=_worker["profiler"])
+    if eval_mode == "batch":
+        _worker["batch"] = ETC_PSO_Batch(**sys_params, profiler=_worker["profiler"])
+
+
+def _chunk_profile():
+    profiler = _worker["profiler"]
+    if profiler is None:
+        return None
+    snapshot = profiler.snapshot()
+    profiler.reset()
+    return snapshot
+
+
+def _eval_chunk(indices, vars, best_scores):
+    if "batch" in _worker:
+        batch = _worker["batch"]
+        scores = batch.eval(vars, best_scores)
+        return indices, scores, batch.aborted, _chunk_profile()
+    
+    scores = []
+    aborted = []
+    bot = _worker["bot"]
+    for curr_vars, best_score in zip(vars, best_scores):
+        bot.vars = curr_vars
+        bot.best_score = best_score
+        scores.append(bot.eval())
+        aborted.append(bot.aborted)
+    return indices, np.array(scores), np.array(aborted), _chunk_profile()
+
+
+def final_eval(sys_params, vars):
+    '''
+    Design variables scored on a scratch member,
+    so that no member of a swarm is moved; the
+    member is returned too for its P, I, D & thresh
+    
+    '''
+    
+    bot = ETC_PSO_Member(**sys_params)
+    bot.vars = vars
+    return bot, bot.eval()
 
 
 ############################################################################################
@@ -16,38 +89,300 @@ class PSO():
     and Event Triggering Threshold value
     Thus, 7 variables in total
     
+    eval_mode -> "serial": members are simulated one by one
+                 "batch": whole swarm is simulated at once
+    executor -> None: members are evaluated in this process
+                "process": members are spread across a process pool
+    num_workers -> Size of the process pool (all cores if None)
+    seed -> Seeds the random streams of the swarm & members
+    update_mode -> "sync": all members are evaluated before any moves
+                   "async": every member moves as soon as its own
+                   evaluation is done (steady state)
+    profile -> Times the phases of every rollout and counts
+               why they ended (RolloutProfiler), one
+               report per iteration in profile_history
+    surrogate -> RBFSurrogate pre-screening the swarm in the
+                 sync update mode, so that only the members
+                 it selects are simulated (None: all of them)
+    
+    Design variables, personal bests & their scores
+    live in the arrays of a SwarmState (one row per
+    member) which the members index into, so the
+    sync update, best tracking & history capture
+    work on the whole swarm at once; the sync update
+    draws its random coefficients from one swarm
+    stream, the async one from the member streams
+    
+    Training can be checkpointed every few iterations
+    and resumed from the checkpoint with load_checkpoint;
+    it can stop early (see train), restart stagnant
+    members around init_guess and follow a schedule
+    of coarser simulations which are refined as the
+    swarm converges (sync update mode)
+    
     '''
     
-    def __init__(self, num_bots, **sys_params) -> None:
+    def __init__(self, num_bots, eval_mode="serial", executor=None, num_workers=None, seed=None, update_mode="sync", profile=False, surrogate=None, **sys_params) -> None:
+        # The path geometry is built once and shared by all members
+        sys_params["path"] = as_geometry(sys_params["path"])
+        self.pool = None
+        self.iteration = 0
+        self.num_evals = 0
+        self.best_stall = 0
+        self.num_aborted = 0
+        self.num_restarts = 0
         self.best_score = 0.
+        self.stop_reason = None
+        self.restart_patience = 0
+        self.profile_history = []
+        self.surrogate = surrogate
+        self.num_screened = 0
+        self.real_evals_history = []
+        self.fidelity_level = 0
+        self.level_start = 0
+        self.level_history = []
+        self.num_rescored = 0
+        self.profiler = RolloutProfiler() if profile else None
+        self.stall = np.zeros(num_bots, dtype=int)
+        self.cache = sys_params.get("cache")
         self.num_bots = num_bots
+        self.executor = executor
+        self.eval_mode = eval_mode
+        self.sys_params = sys_params
+        self.level_params = sys_params
+        self.num_workers = num_workers
+        self.update_mode = update_mode
         self.global_best = sys_params["init_guess"]
-        self.bots = [ETC_PSO_Member(**sys_params) for _ in range(num_bots)]
+        self.init_args = {"num_bots": num_bots,
+                          "eval_mode": eval_mode,
+                          "executor": executor,
+                          "num_workers": num_workers,
+                          "seed": seed,
+                          "update_mode": update_mode,
+                          "profile": profile}
+        
+        # Independent random stream for every member & one for the swarm
+        seed_sequence = np.random.SeedSequence(seed)
+        streams = seed_sequence.spawn(num_bots)
+        self.rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+        self.swarm = SwarmState(num_bots, np.shape(sys_params["init_guess"])[0])
+        self.bots = [ETC_PSO_Member(**sys_params, rng=stream, profiler=self.profiler, swarm=self.swarm, index=index)
+                     for index, stream in enumerate(streams)]
+        if eval_mode == "batch":
+            self.batch = ETC_PSO_Batch(**sys_params, profiler=self.profiler)
+    
+    
+    def open_pool(self):
+        if self.pool is None:
+            self.pool_size = self.num_workers or os.cpu_count()
+            # The fitness cache stays in this process, workers only simulate
+            worker_params = {key: val for key, val in self.level_params.items() if key != "cache"}
+            self.pool = ProcessPoolExecutor(max_workers=self.pool_size,
+                                            initializer=_init_worker,
+                                            initargs=(self.eval_mode, worker_params, self.profiler is not None))
+    
+    
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+    
+    
+    def eval_pool(self, vars, best_scores):
+        '''
+        The swarm is split into chunks which are
+        simulated by the workers; results may come
+        back in any order, so they are placed by
+        their indices
+        
+        '''
+        
+        self.open_pool()
+        scores = np.zeros(vars.shape[0])
+        aborted = np.zeros(vars.shape[0], dtype=bool)
+        num_chunks = min(vars.shape[0], 4*self.pool_size)
+        tasks = [self.pool.submit(_eval_chunk, indices, vars[indices], best_scores[indices])
+                 for indices in np.array_split(np.arange(vars.shape[0]), num_chunks)]
+        for task in as_completed(tasks):
+            indices, chunk_scores, chunk_aborted, chunk_profile = task.result()
+            self.merge_profile(chunk_profile)
+            scores[indices] = chunk_scores
+            aborted[indices] = chunk_aborted
+        return scores, aborted
+    
+    
+    def merge_profile(self, snapshot):
+        if snapshot is not None:
+            self.profiler.merge(snapshot)
+    
+    
+    def eval_swarm(self, vars, best_scores):
+        '''
+        Scores of the whole swarm from the batch
+        simulator or the process pool; design
+        variables found in the fitness cache
+        are not simulated again and aborted
+        rollouts are not cached (they are
+        flagged in the returned mask)
+        
+        '''
+        
+        scores = np.zeros(vars.shape[0])
+        swarm_aborted = np.zeros(vars.shape[0], dtype=bool)
+        pending = np.arange(vars.shape[0])
+        
+        if self.cache is not None:
+            keys = [self.cache.key(self.bots[0].cache_context, curr_vars) for curr_vars in vars]
+            cached = [self.cache.get(key) for key in keys]
+            pending = np.array([index for index, score in enumerate(cached) if score is None], dtype=int)
+            for index, score in enumerate(cached):
+                if score is not None: scores[index] = score
+        
+        if pending.size:
+            if self.executor == "process":
+                scores[pending], aborted = self.eval_pool(vars[pending], best_scores[pending])
+            else:
+                scores[pending] = self.batch.eval(vars[pending], best_scores[pending])
+                aborted = self.batch.aborted
+            self.num_aborted += np.sum(aborted)
+            swarm_aborted[pending] = aborted
+            
+            if self.cache is not None:
+                for index in pending[~aborted]:
+                    self.cache.put(keys[index], scores[index])
+        return scores, swarm_aborted
     
 
     def eval_all(self):
         '''
-        All the members are simulated
-        serially and global best design
-        variables and scores are updated;
-        but parallel execution maybe
-        introduced if needed
+        All the members are simulated (one by
+        one, all at once in batch mode, or in a
+        process pool) and then the personal &
+        global best design variables and scores
+        are updated for the whole swarm at once;
+        the global best goes to the first member
+        with the highest score, so every mode
+        ends in the same state
+        
+        With a surrogate only the members it selects
+        are simulated; the others keep their bests
+        and their predicted scores go to the history
         
         '''
         
-        scores = []
-        curr_vars = []
+        swarm = self.swarm
+        curr_vars = np.copy(swarm.vars)
+        scores = np.zeros(self.num_bots)
+        aborted = np.zeros(self.num_bots, dtype=bool)
+        evaluate = np.ones(self.num_bots, dtype=bool)
+        if self.surrogate is not None:
+            evaluate, predicted = self.surrogate.select(curr_vars)
+            self.num_screened += self.num_bots - int(np.sum(evaluate))
+            if predicted is not None:
+                scores[~evaluate] = predicted[~evaluate]
         
-        for bot in self.bots:
-            score = bot.eval()
-            scores.append(score)
-            curr_vars.append(np.copy(bot.vars))
-            
-            if score > self.best_score:
-                self.global_best = np.copy(bot.vars)
-                self.best_score = score
+        indices = np.flatnonzero(evaluate)
+        if self.executor == "process" or self.eval_mode == "batch":
+            scores[indices], aborted[indices] = self.eval_swarm(curr_vars[indices], swarm.best_score[indices])
+            improved = evaluate & (scores > swarm.best_score)
+            swarm.personal_best[improved] = curr_vars[improved]
+            swarm.best_score[improved] = scores[improved]
+        else:
+            for index in indices:
+                scores[index] = self.bots[index].eval()
+                aborted[index] = self.bots[index].aborted
+            self.num_aborted += np.sum(aborted)
+        
+        real_scores = np.where(evaluate, scores, -np.inf)
+        best = np.argmax(real_scores)
+        if real_scores[best] > self.best_score:
+            self.global_best = np.copy(curr_vars[best])
+            self.best_score = real_scores[best]
+        
+        # Scores of aborted rollouts are only bounds and are not learnt
+        if self.surrogate is not None:
+            learn = evaluate & ~aborted
+            self.surrogate.add(curr_vars[learn], scores[learn])
         return scores, curr_vars
-                
+    
+    
+    def set_fidelity(self, level_params):
+        '''
+        Simulators (members, batch & pool workers)
+        are set up for the system params of a level
+        of the fidelity schedule; the swarm keeps
+        its design variables, bests & random streams
+        
+        '''
+        
+        self.close_pool()
+        self.level_params = level_params
+        for bot in self.bots:
+            bot.configure(level_params["path"], level_params["dt"], level_params["max_iter"])
+        if self.eval_mode == "batch":
+            self.batch = ETC_PSO_Batch(**level_params, profiler=self.profiler)
+    
+    
+    def score_vars(self, vars):
+        '''
+        Scores of the design variables (one row each)
+        which are not members of the swarm, never
+        aborted; in serial mode a scratch member
+        simulates them, so the members are untouched
+        
+        '''
+        
+        self.num_rescored += vars.shape[0]
+        if self.executor == "process" or self.eval_mode == "batch":
+            return self.eval_swarm(vars, np.full(vars.shape[0], -np.inf))[0]
+        
+        bot = ETC_PSO_Member(**self.level_params, profiler=self.profiler)
+        scores = []
+        for curr_vars in vars:
+            bot.vars = curr_vars
+            bot.best_score = -np.inf
+            scores.append(bot.eval())
+        return np.array(scores)
+    
+    
+    def refine(self, schedule, spread):
+        '''
+        Once the current level of the schedule is
+        done the swarm moves on to the next one
+        
+        '''
+        
+        if (self.fidelity_level < len(schedule)
+                and level_done(schedule[self.fidelity_level], self.iteration - self.level_start, spread)):
+            self.set_level(schedule, self.fidelity_level + 1)
+    
+    
+    def set_level(self, schedule, level):
+        '''
+        Swarm moves to a level of the schedule (full
+        fidelity past the last one); the personal &
+        global bests are re-scored at the new level, so
+        scores of different levels are never compared,
+        and the surrogate forgets the old level
+        
+        '''
+        
+        self.fidelity_level = level
+        self.level_start = self.iteration
+        self.level_history.append(self.iteration)
+        self.set_fidelity(fidelity_params(self.sys_params, **schedule[level])
+                          if level < len(schedule) else self.sys_params)
+        
+        vars = np.vstack((self.swarm.personal_best, self.global_best))
+        scores = self.score_vars(vars)
+        self.swarm.best_score[:] = scores[:-1]
+        best = np.argmax(scores)
+        self.global_best = np.copy(vars[best])
+        self.best_score = scores[best]
+        self.best_stall = 0
+        if self.surrogate is not None:
+            self.surrogate.clear()
+    
     
     def update_vars(self):
         '''
@@ -59,47 +394,377 @@ class PSO():
         lr1: Cognitive Learning Rate
         lr2: Social Learning Rate
         c1 and c2 are randomly generated numbers
-        distributed uniformly between 0 to 1
+        distributed uniformly between 0 to 1,
+        drawn for the whole swarm at once
         
         '''
         
-        for bot in self.bots:
-            random_coeffs = np.random.random((2))*self.lrs
-            bot.vars += (random_coeffs[0]*(bot.personal_best-bot.vars) +
-                         random_coeffs[1]*(self.global_best-bot.vars))
+        random_coeffs = self.rng.random((self.num_bots, 2))*self.lrs
+        swarm = self.swarm
+        swarm.vars += (random_coeffs[:, :1]*(swarm.personal_best-swarm.vars) +
+                       random_coeffs[:, 1:]*(self.global_best-swarm.vars))
+    
+    
+    def update_bot(self, bot):
+        random_coeffs = bot.rng.random((2))*self.lrs
+        bot.vars += (random_coeffs[0]*(bot.personal_best-bot.vars) +
+                     random_coeffs[1]*(self.global_best-bot.vars))
+    
+    
+    def track_stagnation(self, index, improved):
+        '''
+        A member whose personal best has not improved
+        for restart_patience of its evaluations is
+        re-randomized around init_guess (within
+        range_var) and starts over like a new member,
+        while the global best is kept; index & improved
+        can be arrays for several members at once
+        
+        '''
+        
+        index = np.atleast_1d(index)
+        self.stall[index] = np.where(improved, 0, self.stall[index] + 1)
+        if self.restart_patience:
+            for curr_index in index[self.stall[index] >= self.restart_patience]:
+                bot = self.bots[curr_index]
+                bot.vars = (self.sys_params["init_guess"]
+                            + (bot.rng.random(bot.vars.shape[0])-0.5)*self.sys_params["range_var"])
+                bot.personal_best = np.copy(bot.vars)
+                bot.best_score = 0.
+                self.stall[curr_index] = 0
+                self.num_restarts += 1
+    
+    
+    def run_async(self, num_iter, end_iteration):
+        '''
+        Steady-state PSO: every member is moved as soon
+        as its own evaluation is done, towards the global
+        best known at that moment, and is sent off again,
+        so no worker waits for the slowest rollout of an
+        iteration; the budget is the same num_bots
+        evaluations per iteration and a row of history
+        (last score & evaluated design variables of every
+        member) is written for every num_bots evaluations
+        
+        '''
+        
+        scores = np.zeros(self.num_bots)
+        curr_vars = np.copy(self.swarm.vars)
+        budget = (num_iter - self.iteration)*self.num_bots
+        num_done = 0
+        
+        def finish(index, score, prev_best):
+            nonlocal num_done
+            bot = self.bots[index]
+            scores[index] = score
+            curr_vars[index] = bot.vars
+            if score > self.best_score:
+                self.global_best = np.copy(bot.vars)
+                self.best_score = score
+            self.update_bot(bot)
+            self.track_stagnation(index, bot.best_score > prev_best)
+            
+            num_done += 1
+            if num_done % self.num_bots == 0:
+                end_iteration(list(scores), np.copy(curr_vars))
+        
+        # In this process the members simply take turns
+        if self.executor != "process":
+            for count in range(budget):
+                if self.stop_reason is not None: break
+                bot = self.bots[count % self.num_bots]
+                prev_best = bot.best_score
+                score = bot.eval()
+                self.num_aborted += bot.aborted
+                finish(count % self.num_bots, score, prev_best)
+            return
+        
+        # Members still running when training stops are dropped
+        self.open_pool()
+        tasks = {}
+        num_sent = 0
+        ready = deque(range(self.num_bots))
+        while self.stop_reason is None and (tasks or (ready and num_sent < budget)):
+            while ready and num_sent < budget and self.stop_reason is None:
+                index = ready.popleft()
+                bot = self.bots[index]
+                num_sent += 1
+                
+                key = None
+                if self.cache is not None:
+                    key = self.cache.key(bot.cache_context, bot.vars)
+                    score = self.cache.get(key)
+                    if score is not None:
+                        prev_best = bot.best_score
+                        bot.update_best(score)
+                        finish(index, score, prev_best)
+                        ready.append(index)
+                        continue
+                tasks[self.pool.submit(_eval_chunk, [index], bot.vars[None], np.array([bot.best_score]))] = key
+            
+            if tasks:
+                done, _ = wait(tasks, return_when=FIRST_COMPLETED)
+                for task in done:
+                    key = tasks.pop(task)
+                    indices, chunk_scores, chunk_aborted, chunk_profile = task.result()
+                    self.merge_profile(chunk_profile)
+                    index, score = indices[0], chunk_scores[0]
+                    self.num_aborted += chunk_aborted[0]
+                    if self.cache is not None and not chunk_aborted[0]:
+                        self.cache.put(key, score)
+                    prev_best = self.bots[index].best_score
+                    self.bots[index].update_best(score)
+                    finish(index, score, prev_best)
+                    ready.append(index)
 
 
-    def train(self, num_iter, learning_rates):
+    def save_checkpoint(self, file, history):
         '''
-        Training PSO
+        Full state of the swarm (design variables,
+        personal & global bests, random streams,
+        fitness cache and the history so far) is
+        pickled to a temporary file which then
+        replaces the checkpoint, so a crash while
+        writing never leaves a broken checkpoint
+        
+        '''
+        
+        state = {"init_args": self.init_args,
+                 "sys_params": {key: val for key, val in self.sys_params.items() if key != "cache"},
+                 "cache": self.cache,
+                 "surrogate": self.surrogate,
+                 "num_screened": self.num_screened,
+                 "real_evals_history": self.real_evals_history,
+                 "fidelity_level": self.fidelity_level,
+                 "level_start": self.level_start,
+                 "level_history": self.level_history,
+                 "num_rescored": self.num_rescored,
+                 "iteration": self.iteration,
+                 "num_evals": self.num_evals,
+                 "best_stall": self.best_stall,
+                 "stall": self.stall,
+                 "num_restarts": self.num_restarts,
+                 "num_aborted": self.num_aborted,
+                 "profile_history": self.profile_history,
+                 "best_score": self.best_score,
+                 "global_best": self.global_best,
+                 "swarm": {"vars": self.swarm.vars,
+                           "personal_best": self.swarm.personal_best,
+                           "best_score": self.swarm.best_score},
+                 "rng": self.rng.bit_generator.state,
+                 "member_rngs": [bot.rng.bit_generator.state for bot in self.bots],
+                 "history": history}
+        
+        with open(file + ".tmp", "wb") as curr_file:
+            pickle.dump(state, curr_file, protocol=pickle.HIGHEST_PROTOCOL)
+            curr_file.flush()
+            os.fsync(curr_file.fileno())
+        os.replace(file + ".tmp", file)
+    
+    
+    @classmethod
+    def load_checkpoint(cls, file):
+        '''
+        Swarm rebuilt from a checkpoint along with its
+        history; calling train on it with the same
+        num_iter continues bit for bit where the
+        checkpointed run left off
+        
+        '''
+        
+        with open(file, "rb") as curr_file:
+            state = pickle.load(curr_file)
+        
+        pso = cls(**state["init_args"], **state["sys_params"], cache=state["cache"], surrogate=state["surrogate"])
+        pso.num_screened = state["num_screened"]
+        pso.real_evals_history = state["real_evals_history"]
+        pso.fidelity_level = state["fidelity_level"]
+        pso.level_start = state["level_start"]
+        pso.level_history = state["level_history"]
+        pso.num_rescored = state["num_rescored"]
+        pso.iteration = state["iteration"]
+        pso.num_evals = state["num_evals"]
+        pso.best_stall = state["best_stall"]
+        pso.stall = state["stall"]
+        pso.num_restarts = state["num_restarts"]
+        pso.num_aborted = state["num_aborted"]
+        pso.profile_history = state["profile_history"]
+        pso.best_score = state["best_score"]
+        pso.global_best = state["global_best"]
+        pso.swarm.vars[:] = state["swarm"]["vars"]
+        pso.swarm.personal_best[:] = state["swarm"]["personal_best"]
+        pso.swarm.best_score[:] = state["swarm"]["best_score"]
+        pso.rng.bit_generator.state = state["rng"]
+        for bot, rng_state in zip(pso.bots, state["member_rngs"]):
+            bot.rng.bit_generator.state = rng_state
+        return pso, state["history"]
+    
+    
+    def migrants(self, num_migrants):
+        '''
+        Personal bests & scores of the best
+        members, sent to other swarms
+        
+        '''
+        
+        order = np.argsort(-self.swarm.best_score, kind="stable")[:num_migrants]
+        return self.swarm.personal_best[order], self.swarm.best_score[order]
+    
+    
+    def accept_migrants(self, vars, scores):
+        '''
+        Migrants (best first) take the place of the
+        members with the worst personal bests, where
+        they are better; the global best may move too
+        
+        '''
+        
+        order = np.argsort(-scores, kind="stable")
+        worst = np.argsort(self.swarm.best_score, kind="stable")
+        for index, curr_vars, score in zip(worst, vars[order], scores[order]):
+            bot = self.bots[index]
+            if score > bot.best_score:
+                bot.vars = np.copy(curr_vars)
+                bot.personal_best = np.copy(curr_vars)
+                bot.best_score = score
+            if score > self.best_score:
+                self.global_best = np.copy(curr_vars)
+                self.best_score = score
+    
+    
+    def train(self, num_iter, learning_rates, history=None, checkpoint_file=None, checkpoint_every=0, verbose=True,
+              patience=0, spread_tol=0., time_budget=None, eval_budget=None, restart_patience=0, fidelity_schedule=None,
+              finalize=True):
+        '''
+        Training PSO up to num_iter iterations in total
+        (a resumed swarm starts from its checkpoint);
+        the history of every iteration goes into a
+        HistorySink (in memory if None) and the swarm is
+        checkpointed every checkpoint_every iterations
+        
+        Training stops early (checked after every iteration) if:
+        patience -> the best score has not improved for this
+                    many iterations (0: never)
+        spread_tol -> the spread of the swarm (largest std of a
+                      design variable relative to range_var)
+                      falls below this tolerance
+        time_budget -> this many seconds of training are used up
+        eval_budget -> this many evaluations (num_bots per
+                       iteration) are used up
+        restart_patience -> members whose personal best has not
+                            improved for this many evaluations are
+                            re-randomized around init_guess (0: never)
+        
+        fidelity_schedule -> Levels of coarser simulation (see
+                             fidelity_params) the sync swarm is
+                             trained with before full fidelity;
+                             training always ends at full fidelity
+        
+        finalize -> Returns the results of finalize; False only
+                    runs the iterations (training in parts, as
+                    the islands do, then matches a single run)
         
         '''
         
-        vars_history = []
-        scores_history = []
-        best_scores_history = []
         self.lrs = learning_rates
+        self.stop_reason = None
+        self.restart_patience = restart_patience
+        schedule = fidelity_schedule if fidelity_schedule and self.update_mode == "sync" else []
+        # Bests of a fresh swarm are re-scored at the first level,
+        # a resumed one is only set up for the level it was at
+        if self.fidelity_level < len(schedule):
+            if self.level_history:
+                self.set_fidelity(fidelity_params(self.sys_params, **schedule[self.fidelity_level]))
+            else:
+                self.set_level(schedule, 0)
+        if self.profiler is not None:
+            self.profiler.reset()
+        if history is None:
+            history = HistorySink(num_iter, self.num_bots)
+        start = time.perf_counter() - history.elapsed()
+        progress = tqdm(initial=self.iteration, total=num_iter, disable=not verbose)
         
-        for _ in tqdm(range(num_iter)):
-            scores, curr_vars = self.eval_all()
-            self.update_vars()
+        def end_iteration(scores, curr_vars):
+            elapsed = time.perf_counter() - start
+            # Best scores of an earlier fidelity level are not compared
+            prev_best = (history.history()["best_scores_history"][-1]
+                         if history.count and self.iteration > self.level_start else -np.inf)
+            self.best_stall = 0 if self.best_score > prev_best else self.best_stall + 1
+            history.append(scores, curr_vars, self.best_score, elapsed)
+            if self.profiler is not None:
+                self.profile_history.append(self.profiler.snapshot())
+                self.profiler.reset()
+            self.num_evals += self.num_bots
+            self.real_evals_history.append(self.num_evals - self.num_screened)
+            self.iteration += 1
+            progress.update()
+            
+            spread = np.max(np.std(curr_vars, axis=0)/self.sys_params["range_var"])
+            self.refine(schedule, spread)
+            if checkpoint_every and self.iteration % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_file, history)
             
-            scores_history.append(scores)
-            vars_history.append(curr_vars)
-            best_scores_history.append(self.best_score)
+            if patience and self.best_stall >= patience:
+                self.stop_reason = "patience"
+            elif spread < spread_tol:
+                self.stop_reason = "spread"
+            elif time_budget is not None and elapsed >= time_budget:
+                self.stop_reason = "time_budget"
+            elif eval_budget is not None and self.num_evals >= eval_budget:
+                self.stop_reason = "eval_budget"
         
-        bot = self.bots[0]
-        bot.vars = self.global_best
-        score = bot.eval()
+        try:
+            if self.update_mode == "async":
+                self.run_async(num_iter, end_iteration)
+            while self.iteration < num_iter and self.stop_reason is None:
+                prev_best = np.copy(self.swarm.best_score)
+                scores, curr_vars = self.eval_all()
+                self.update_vars()
+                self.track_stagnation(np.arange(self.num_bots), self.swarm.best_score > prev_best)
+                end_iteration(scores, curr_vars)
+            # A run stopped before the end of the schedule ends at full fidelity
+            if self.fidelity_level < len(schedule):
+                self.set_level(schedule, len(schedule))
+        finally:
+            progress.close()
+            self.close_pool()
+            history.flush()
+        
+        if finalize:
+            return self.finalize(history)
+    
+    
+    def finalize(self, history):
+        '''
+        Global best re-evaluated on a scratch member
+        (at full fidelity) and the results of training
+        with its history
+        
+        '''
         
+        bot, score = final_eval(self.sys_params, self.global_best)
         output_dict = {"P": bot.P,
                        "I": bot.I,
                        "D": bot.D,
                        "max_score": score,
                        "thresh": bot.thresh,
-                       "vars_history": np.array(vars_history),
-                       "scores_history": np.array(scores_history),
-                       "best_scores_history": np.array(best_scores_history)}
+                       "stop_reason": self.stop_reason or "num_iter",
+                       "stop_iter": self.iteration,
+                       **history.history()}
+        if self.restart_patience:
+            output_dict["num_restarts"] = self.num_restarts
+        if self.cache is not None:
+            output_dict["cache_stats"] = self.cache.stats()
+        if self.sys_params.get("early_abort"):
+            output_dict["aborted_rollouts"] = int(self.num_aborted)
+        if self.profiler is not None:
+            output_dict["profile"] = list(self.profile_history)
+        if self.level_history:
+            output_dict["fidelity_stats"] = {"level_starts": list(self.level_history),
+                                             "rescored": self.num_rescored}
+        if self.surrogate is not None:
+            output_dict["surrogate_stats"] = {"screened": self.num_screened,
+                                              "real_evals": list(self.real_evals_history)}
         return output_dict
         
 
@@ -1,7 +1,10 @@
 import os; os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
+import math
 import pygame
 import numpy as np
-from .bot_sim import Bot
+from .bot_sim import Bot, quad_form
+from .rollout_profiler import RolloutProfiler
+from .trajectory_recorder import TrajectoryRecorder
 
 
 ############################################################################################
@@ -14,17 +17,55 @@ class GameHandler(Bot):
     this is used to show the simulation
     using PyGame Window
     
+    headless -> Draws on an offscreen surface (SDL dummy
+                driver, unless SDL_VIDEODRIVER is already
+                set) without polling events or capping
+                the frame rate; as there is no window to
+                close, the simulation also ends like a
+                rollout does once the error exceeds 1e2
+                under Q_err or after max_iter steps
+    render -> False skips drawing (and saving frames) entirely;
+              headless & without rendering the simulation
+              runs on plain floats (see simulate_scalar)
+    frame_step -> Every Nth frame is saved as a png to
+                  frame_folder (0 saves none)
+    dirty_rects -> Only the areas around the old & new bot
+                   position and the waypoint marker are
+                   redrawn and updated on every frame
+    profile -> Times the phases of simulate (event polling
+               is left out) in self.profiler
+    
     '''
     
-    def __init__(self, x_screen, y_screen, bot_radius, Q, dt) -> None:
+    def __init__(self, x_screen, y_screen, bot_radius, Q, dt, Q_err, max_iter, headless=False, render=True, frame_step=0, frame_folder=None, dirty_rects=False, profile=False) -> None:
+        # The dummy driver is only set if no driver was chosen & removed again on quit
+        self.set_driver = headless and "SDL_VIDEODRIVER" not in os.environ
+        if self.set_driver:
+            os.environ['SDL_VIDEODRIVER'] = "dummy"
         pygame.init()
         super().__init__(dt)
         
         self.Q = Q
+        self.Q_ = Q_err
+        self.max_iter = max_iter
+        self.stop_reason = None
         self.r = bot_radius
+        self.render = render
+        self.headless = headless
+        self.frame_step = frame_step
+        self.frame_folder = frame_folder
+        self.dirty_rects = dirty_rects
+        self.prev_rects = []
+        self.profiler = RolloutProfiler() if profile else None
+        if frame_step and render:
+            os.makedirs(frame_folder, exist_ok=True)
+        
         self.clock = pygame.time.Clock()
         self.x_screen = x_screen; self.y_screen = y_screen
-        self.screen = pygame.display.set_mode((x_screen, y_screen))
+        if headless:
+            self.screen = pygame.Surface((x_screen, y_screen))
+        else:
+            self.screen = pygame.display.set_mode((x_screen, y_screen))
         self.path_screen = pygame.Surface((x_screen, y_screen))
         
         self.bg_1 = (16, 20, 31)
@@ -41,13 +82,16 @@ class GameHandler(Bot):
     
     def quit(self):
         pygame.quit()
+        if self.set_driver:
+            del os.environ['SDL_VIDEODRIVER']
+            self.set_driver = False
     
     
     def load_bot(self, path, P, I, D):
         self.load(path, P, I, D)
         self.path_screen.fill(self.bg_1)
-        pygame.draw.lines(self.path_screen, self.bg_2, False, path, 2)
-        for pt in path:
+        pygame.draw.lines(self.path_screen, self.bg_2, False, self.path_coord, 2)
+        for pt in self.path_coord:
             pygame.draw.circle(self.path_screen, self.dot_1, pt, 2)
             
         font = pygame.font.SysFont('Comic Sans MS', 20)
@@ -55,75 +99,231 @@ class GameHandler(Bot):
         text_rect = text.get_rect()
         text_rect.center = (self.x_screen//2, 10)
         self.path_screen.blit(text, text_rect)
+        self.prev_rects = []
         
     
     
     def draw(self):
+        '''
+        With dirty_rects the background is restored
+        only where the bot & the waypoint marker were
+        drawn in the previous frame (the whole window
+        right after load_bot), and only those areas
+        and the newly drawn ones are updated
+        
+        '''
+        
         curr_pos = self.curr_state[:2]
         pygame.draw.circle(self.path_screen, self.dot_2, curr_pos, 1)
-        self.screen.blit(self.path_screen, (0,0))
-        pygame.draw.circle(self.screen, self.body, curr_pos, self.r)
-        pygame.draw.line(self.screen, self.border, curr_pos, curr_pos+(self.r*self.dir), self.r//5)
-        pygame.draw.circle(self.screen, self.border, curr_pos, 1.1*self.r, self.r//5)
-        pygame.draw.circle(self.screen, self.color, curr_pos, self.r//5)
-        pygame.draw.circle(self.screen, "white", self.path_coord[self.curr_index], 4)
-        pygame.display.update()
+        if self.dirty_rects and self.prev_rects:
+            for rect in self.prev_rects:
+                self.screen.blit(self.path_screen, rect, rect)
+        else:
+            self.screen.blit(self.path_screen, (0,0))
+        
+        rects = [pygame.draw.circle(self.screen, self.body, curr_pos, self.r),
+                 pygame.draw.line(self.screen, self.border, curr_pos, curr_pos+(self.r*self.dir), self.r//5),
+                 pygame.draw.circle(self.screen, self.border, curr_pos, 1.1*self.r, self.r//5),
+                 pygame.draw.circle(self.screen, self.color, curr_pos, self.r//5),
+                 pygame.draw.circle(self.screen, "white", self.path_coord[self.curr_index], 4)]
         
+        if not self.headless:
+            if self.dirty_rects and self.prev_rects:
+                pygame.display.update(self.prev_rects + rects)
+            else:
+                pygame.display.update()
+        self.prev_rects = rects
+    
+    
+    def save_frame(self, frame):
+        pygame.image.save(self.screen, os.path.join(self.frame_folder, f"frame_{frame:06d}.png"))
+        
+    
+    def outputs(self, records, count_with_etc, count_with_ttc):
+        '''
+        Plot data from the records of simulate; the
+        wheel velocity magnitudes are computed for
+        all the steps at once
+        
+        '''
+        
+        records = records.array()
+        v_mag = np.sqrt((records[:, None, :2] @ records[:, :2, None])[:, 0, 0])
+        return {"v_left": v_mag + self.r*records[:, 4],
+                "v_right": v_mag - self.r*records[:, 4],
+                "bot_traj": records[:, :2],
+                "pos_error": records[:, 2],
+                "count_with_etc": count_with_etc,
+                "count_with_ttc": count_with_ttc,
+                "angle_error": records[:, 3],
+                "etc_instants": np.flatnonzero(records[:, 5]),
+                "stop_reason": self.stop_reason,
+                }
+    
     
     def simulate(self, thresh, plot_flag=0):
+        if self.headless and not self.render:
+            return self.simulate_scalar(thresh, plot_flag)
+        
+        # Columns: x, y, pos_error, angle_error, heading, etc trigger
         if plot_flag:
-            v_left = []
-            v_right = []
-            bot_traj = []
-            pos_error = []
-            angle_error = []
-            etc_instants = []
+            records = TrajectoryRecorder(num_cols=6, track_dist=False)
         
         running = True
+        reason = "quit"
         count_with_etc = 0
         count_with_ttc = 0
+        profiler = self.profiler
         prev_err_vel = np.zeros(self.num_inputs)
         
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT: running = False; break
+            if not self.headless:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT: running = False; break
+            if profiler is not None:
+                profiler.start()
             stop_flag, err_vel = self.get_vels()
-            if stop_flag: running = False; break
+            if profiler is not None:
+                profiler.lap("get_vels")
+            if stop_flag: running = False; reason = "path_end"; break
             
             del_err = err_vel-prev_err_vel
-            if del_err.T @ self.Q @ del_err >= thresh:
+            trigger = quad_form(del_err, self.Q) >= thresh
+            if profiler is not None:
+                profiler.steps += 1
+                profiler.fired += trigger
+                profiler.lap("trigger")
+            if trigger:
                 count_with_etc += 1
                 self.step_sim(err_vel)
                 self.color = self.green
                 prev_err_vel = np.copy(err_vel)
-                if plot_flag: etc_instants.append(count_with_ttc)
             else:
                 self.color = self.red
                 self.step_sim(prev_err_vel)
+            if profiler is not None:
+                profiler.lap("step_sim")
+            if self.headless:
+                if quad_form(self.err, self.Q_) > 1e2: running = False; reason = "error"
+                elif count_with_ttc > self.max_iter: running = False; reason = "max_iter"
             count_with_ttc += 1
             
             if plot_flag:
-                pos_error.append(self.err[0])
-                angle_error.append(self.err[1])
-                bot_traj.append(np.copy(self.curr_state[:2]))
-                v_mag = np.linalg.norm(self.curr_state[:2])
-                v_left.append(v_mag + self.r*self.curr_state[-1])
-                v_right.append(v_mag - self.r*self.curr_state[-1])
+                records.append(self.curr_state[0], self.curr_state[1],
+                               self.err[0], self.err[1],
+                               self.curr_state[-1], trigger)
+            if profiler is not None:
+                profiler.lap("bookkeeping")
+            
+            if self.render:
+                self.draw()
+                if self.frame_step and count_with_ttc % self.frame_step == 0:
+                    self.save_frame(count_with_ttc)
+            if not self.headless:
+                self.clock.tick(50)
+            if profiler is not None:
+                profiler.lap("render")
+        
+        self.stop_reason = reason
+        if profiler is not None:
+            profiler.terminate(reason)
+        if plot_flag:
+            return self.outputs(records, count_with_etc, count_with_ttc)
+    
+    
+    def simulate_scalar(self, thresh, plot_flag=0):
+        '''
+        Same simulation as simulate for a headless run
+        without rendering, with the arithmetic of
+        ETC_PSO_Member.rollout_scalar on plain floats;
+        the records & final state are identical, and
+        with profiling the run is timed as a whole;
+        it ends at the end of the path, once the error
+        exceeds 1e2 under Q_err or after max_iter steps
+        
+        '''
+        
+        if plot_flag:
+            records = TrajectoryRecorder(num_cols=6, track_dist=False)
+        
+        P_0, P_1 = float(self.P[0]), float(self.P[1])
+        I_0, I_1 = float(self.I[0]), float(self.I[1])
+        D_0, D_1 = float(self.D[0]), float(self.D[1])
+        Q_00, Q_01, Q_10, Q_11 = np.asarray(self.Q, dtype=float).ravel().tolist()
+        R_00, R_01, R_10, R_11 = np.asarray(self.Q_, dtype=float).ravel().tolist()
+        thresh, dt, max_iter = float(thresh), self.dt, self.max_iter
+        
+        x, y, theta = self.curr_state.tolist()
+        cos_t, sin_t = self.dir.tolist()
+        err_0, err_1 = self.err.tolist()
+        path = self.path.points
+        num_way_points = self.num_way_points
+        curr_index = self.curr_index
+        
+        reason = None
+        trigger = False
+        count_with_etc = 0
+        count_with_ttc = 0
+        prev_vel_0 = prev_vel_1 = 0.
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        
+        while True:
+            prev_err_0, prev_err_1 = err_0, err_1
+            del_x = x - path[curr_index][0]
+            del_y = y - path[curr_index][1]
+            err_0 = math.sqrt(del_x*del_x + del_y*del_y)
+            err_1 = (cos_t*del_y - sin_t*del_x)/(err_0+1e-3)
+            
+            vel_0 = err_0*P_0 + (err_0+prev_err_0)*I_0*0.5 + (err_0-prev_err_0)*D_0
+            vel_1 = err_1*P_1 + (err_1+prev_err_1)*I_1*0.5 + (err_1-prev_err_1)*D_1
             
-            self.draw()
-            self.clock.tick(50)
+            if err_0 <= 50.:
+                curr_index += 1
+                if curr_index == num_way_points: reason = "path_end"; break
+            
+            del_vel_0 = vel_0 - prev_vel_0
+            del_vel_1 = vel_1 - prev_vel_1
+            trigger = ((del_vel_0*Q_00 + del_vel_1*Q_10)*del_vel_0
+                       + (del_vel_0*Q_01 + del_vel_1*Q_11)*del_vel_1) >= thresh
+            if trigger:
+                count_with_etc += 1
+                prev_vel_0, prev_vel_1 = vel_0, vel_1
+            
+            x += prev_vel_0*dt*cos_t
+            y += prev_vel_0*dt*sin_t
+            theta += prev_vel_1*dt
+            cos_t, sin_t = math.cos(theta), math.sin(theta)
+            if abs(theta) >= math.pi:
+                theta = -theta
+            
+            if ((err_0*R_00 + err_1*R_10)*err_0 + (err_0*R_01 + err_1*R_11)*err_1) > 1e2:
+                reason = "error"
+            elif count_with_ttc > max_iter:
+                reason = "max_iter"
+            count_with_ttc += 1
+            
+            if plot_flag:
+                records.append(x, y, err_0, err_1, theta, trigger)
+            if reason is not None: break
+        
+        self.stop_reason = reason
+        if profiler is not None:
+            profiler.lap("rollout")
+            profiler.steps += count_with_ttc
+            profiler.fired += count_with_etc
+            profiler.terminate(reason)
+        
+        self.err[:] = err_0, err_1
+        self.prev_err[:] = err_0, err_1
+        self.curr_index = curr_index
+        self.curr_state[:] = x, y, theta
+        self.dir[:] = cos_t, sin_t
+        self.color = self.green if trigger else self.red
         
         if plot_flag:
-            output_dict = {"v_left": np.array(v_left),
-                           "v_right": np.array(v_right),
-                           "bot_traj": np.array(bot_traj),
-                           "pos_error": np.array(pos_error),
-                           "count_with_etc": count_with_etc,
-                           "count_with_ttc": count_with_ttc,
-                           "angle_error": np.array(angle_error),
-                           "etc_instants": np.array(etc_instants),
-                           }
-            return output_dict
+            return self.outputs(records, count_with_etc, count_with_ttc)
         
 
 ############################################################################################
@@ -0,0 +1,139 @@
+import json
+import time
+
+
+############################################################################################
+############################################################################################
+
+
+class RolloutProfiler():
+    '''
+    Counts & times the phases of the rollout loop
+    (get_vels, trigger test, step_sim, bookkeeping
+    and render for the pygame simulation; the fused
+    scalar & event kernels are timed as a whole
+    rollout), the time
+    steps simulated (a batch step counts every row),
+    how often the ETC trigger fires and why every
+    rollout ended:
+
+    path_end -> last waypoint reached
+    error -> weighed error went above 1e2
+    max_iter -> ran out of time steps
+    aborted -> could not beat the personal best any more
+    quit -> pygame window closed
+
+    Simulators only hold a profiler when profiling
+    is switched on, so nothing is paid otherwise
+
+    '''
+
+    phases = ("get_vels", "trigger", "step_sim", "bookkeeping", "render", "rollout")
+    reasons = ("path_end", "error", "max_iter", "aborted", "quit")
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.steps = 0
+        self.fired = 0
+        self.last = 0
+        self.calls = dict.fromkeys(self.phases, 0)
+        self.times = dict.fromkeys(self.phases, 0)
+        self.terminations = dict.fromkeys(self.reasons, 0)
+
+
+    def start(self):
+        self.last = time.perf_counter_ns()
+
+
+    def lap(self, phase):
+        '''
+        Time since the previous lap (or start)
+        is charged to phase
+
+        '''
+
+        now = time.perf_counter_ns()
+        self.times[phase] += now - self.last
+        self.calls[phase] += 1
+        self.last = now
+
+
+    def terminate(self, reason, count=1):
+        self.terminations[reason] += int(count)
+
+
+    def snapshot(self):
+        '''
+        Plain dict of the counts so far, which can
+        be sent between processes & merged
+
+        '''
+
+        return {"steps": int(self.steps),
+                "fired": int(self.fired),
+                "calls": dict(self.calls),
+                "times": dict(self.times),
+                "terminations": dict(self.terminations)}
+
+
+    def merge(self, snapshot):
+        self.steps += snapshot["steps"]
+        self.fired += snapshot["fired"]
+        for phase in self.phases:
+            self.calls[phase] += snapshot["calls"][phase]
+            self.times[phase] += snapshot["times"][phase]
+        for reason in self.reasons:
+            self.terminations[reason] += snapshot["terminations"][reason]
+
+
+    def report(self):
+        '''
+        Readable summary: time (s), calls, mean time
+        per call (us) & share of the total time of every
+        phase that ran, termination counts and the
+        fraction of steps on which the trigger fired
+
+        '''
+
+        total = sum(self.times.values())
+        phases = {phase: {"calls": self.calls[phase],
+                          "time_s": self.times[phase]*1e-9,
+                          "mean_us": self.times[phase]*1e-3/self.calls[phase],
+                          "share": self.times[phase]/total if total else 0.}
+                  for phase in self.phases if self.calls[phase]}
+        return {"num_rollouts": sum(self.terminations.values()),
+                "num_steps": self.steps,
+                "trigger_rate": self.fired/self.steps if self.steps else 0.,
+                "terminations": dict(self.terminations),
+                "phases": phases}
+
+
+def merge_snapshots(snapshots):
+    profiler = RolloutProfiler()
+    for snapshot in snapshots:
+        profiler.merge(snapshot)
+    return profiler
+
+
+def save_profile(file, training, validation=None):
+    '''
+    JSON report with one entry per PSO iteration
+    (from its snapshot) and the total over training,
+    plus the pygame validation run if given
+
+    '''
+
+    report = {"training": [dict(iteration=iteration, **merge_snapshots([snapshot]).report())
+                           for iteration, snapshot in enumerate(training, 1)],
+              "training_total": merge_snapshots(training).report()}
+    if validation is not None:
+        report["validation"] = merge_snapshots([validation]).report()
+    with open(file, "w") as curr_file:
+        json.dump(report, curr_file, indent=2)
+
+
+############################################################################################
+############################################################################################
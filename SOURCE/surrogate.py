@@ -0,0 +1,111 @@
+import numpy as np
+
+
+############################################################################################
+############################################################################################
+
+
+class RBFSurrogate():
+    '''
+    Gaussian RBF (kriging) regressor of the scores
+    over the design variables, fitted on the most
+    recent scored vectors; it pre-screens the swarm
+    so that only the members with the highest
+    mean + kappa*std (promising or uncertain) are
+    simulated for real
+
+    scale -> Design variables are divided by it (range_var)
+    max_points -> Most recent scored vectors kept for fitting
+    length_scale -> Of the kernel in scaled units (median
+                    distance between the points if None)
+    noise -> Added to the diagonal of the kernel matrix
+    screen_fraction -> Fraction of the members simulated for real
+    kappa -> Weight of the uncertainty in the ranking
+    min_points -> Scored vectors needed before screening starts
+
+    Scores below the 5th percentile are clipped to it
+    before fitting, so that the huge penalties of failed
+    rollouts do not flatten the rest of the landscape
+
+    '''
+
+    def __init__(self, scale, max_points=500, length_scale=None, noise=1e-6,
+                 screen_fraction=0.5, kappa=1., min_points=50):
+        self.scale = np.asarray(scale, dtype=float)
+        self.max_points = max_points
+        self.length_scale = length_scale
+        self.noise = noise
+        self.screen_fraction = screen_fraction
+        self.kappa = kappa
+        self.min_points = min_points
+        self.clear()
+
+
+    def __len__(self):
+        return self.scores.shape[0]
+
+
+    def add(self, vars, scores):
+        self.vars = np.concatenate((self.vars, np.reshape(vars, (-1, self.scale.shape[0]))))[-self.max_points:]
+        self.scores = np.concatenate((self.scores, np.ravel(scores)))[-self.max_points:]
+
+
+    def clear(self):
+        self.vars = np.zeros((0, self.scale.shape[0]))
+        self.scores = np.zeros(0)
+
+
+    def kernel(self, x_1, x_2):
+        sq_dist = np.sum((x_1[:, None, :] - x_2[None, :, :])**2, axis=-1)
+        return np.exp(-0.5*sq_dist/self.curr_length_scale**2)
+
+
+    def fit(self):
+        points = self.vars/self.scale
+        scores = np.maximum(self.scores, np.percentile(self.scores, 5))
+        self.mean = np.mean(scores)
+        self.std = np.std(scores) or 1.
+
+        self.curr_length_scale = self.length_scale
+        if self.curr_length_scale is None:
+            dist = np.sqrt(np.sum((points[:, None, :] - points[None, :, :])**2, axis=-1))
+            self.curr_length_scale = np.median(dist[np.triu_indices(len(self), 1)]) or 1.
+
+        self.points = points
+        self.K_inv = np.linalg.inv(self.kernel(points, points) + self.noise*np.eye(len(self)))
+        self.alpha = self.K_inv @ ((scores - self.mean)/self.std)
+
+
+    def predict(self, vars):
+        '''
+        Mean & std of the predicted scores
+
+        '''
+
+        k = self.kernel(np.atleast_2d(vars)/self.scale, self.points)
+        var = np.maximum(1. - np.sum((k @ self.K_inv)*k, axis=1), 0.)
+        return self.mean + self.std*(k @ self.alpha), self.std*np.sqrt(var)
+
+
+    def select(self, vars):
+        '''
+        Mask of the members to simulate for real (all
+        of them until min_points vectors are scored)
+        and the predicted scores of all the members
+
+        '''
+
+        if len(self) < self.min_points:
+            return np.ones(vars.shape[0], dtype=bool), None
+
+        self.fit()
+        mean, std = self.predict(vars)
+        num_real = max(1, int(np.ceil(self.screen_fraction*vars.shape[0])))
+        order = np.argsort(-(mean + self.kappa*std), kind="stable")
+        evaluate = np.zeros(vars.shape[0], dtype=bool)
+        evaluate[order[:num_real]] = True
+        return evaluate, mean
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,25 @@
+import numpy as np
+
+
+############################################################################################
+############################################################################################
+
+
+class SwarmState():
+    '''
+    Contiguous state of a swarm, one row per
+    member: design variables & personal bests
+    (num_bots, num_vars) and personal best scores
+    (num_bots,); members read & write their own
+    row by index, the swarm works on whole arrays
+
+    '''
+
+    def __init__(self, num_bots, num_vars=7):
+        self.vars = np.zeros((num_bots, num_vars))
+        self.personal_best = np.zeros((num_bots, num_vars))
+        self.best_score = np.zeros(num_bots)
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,78 @@
+import math
+import numpy as np
+
+
+############################################################################################
+############################################################################################
+
+
+class TrajectoryRecorder():
+    '''
+    Preallocated buffer for the per step records
+    of a simulation, which doubles its size when
+    full instead of growing a Python list; the
+    distance travelled (through the first two
+    values of every record: x, y) is accumulated
+    as the records come in
+
+    num_cols -> Number of values recorded per step
+    capacity -> Initial number of rows of the buffer
+    record -> False keeps only the distance travelled
+              (scoring-only mode, nothing is stored)
+    track_dist -> False skips the distance travelled
+
+    '''
+
+    def __init__(self, num_cols=2, capacity=1024, record=True, track_dist=True):
+        self.record = record
+        self.num_cols = num_cols
+        self.track_dist = track_dist
+        self.buffer = np.zeros((capacity, num_cols)) if record else None
+        self.reset()
+
+
+    def reset(self):
+        self.count = 0
+        self.dist = 0.
+        self.prev_x = self.prev_y = 0.
+
+
+    def grow(self):
+        buffer = np.zeros((2*self.buffer.shape[0], self.num_cols))
+        buffer[:self.count] = self.buffer[:self.count]
+        self.buffer = buffer
+
+
+    def append(self, *vals):
+        '''
+        Distance is added from the previous record
+        on, so the first one only sets the start
+
+        '''
+
+        if self.track_dist:
+            x, y = float(vals[0]), float(vals[1])
+            if self.count:
+                del_x = x - self.prev_x
+                del_y = y - self.prev_y
+                self.dist += math.sqrt(del_x*del_x + del_y*del_y)
+            self.prev_x, self.prev_y = x, y
+
+        if self.record:
+            if self.count == self.buffer.shape[0]:
+                self.grow()
+            self.buffer[self.count] = vals
+        self.count += 1
+
+
+    def array(self):
+        '''
+        View of the records so far (count, num_cols)
+
+        '''
+
+        return self.buffer[:self.count]
+
+
+############################################################################################
+############################################################################################
@@ -11,6 +11,12 @@ from perlin_noise import PerlinNoise
 
 y_screen -> dimensions of simulation window
 x_screen -> dimensions of simulation window
+headless -> Simulation window is drawn offscreen (SDL dummy driver if none is set) with no frame cap,
+            ending once the error exceeds 1e2 under Q_err or after max_iter steps
+render -> False skips drawing the simulation entirely (headless: runs on plain floats, thousands of times faster than real time)
+frame_step -> Every Nth frame of the simulation is saved as a png (0 saves none)
+frame_folder -> Folder for the saved frames (FRAMES in the output folder if None)
+dirty_rects -> Only the areas around the bot & the waypoint marker are redrawn every frame
                 
 dt -> Value of one time step
 init_guess -> Initial Guess for PSO
@@ -18,10 +24,57 @@ max_iter -> Max no. of iterations for simulation
 range_var -> Range of variables randomly chosen around init_guess
 Q_ETC -> diff_input.T @ Q_ETC @ diff_input: Weights for determining ETC triggers
 Q_err -> err.T @ Q_err @ err: Weights for determining current linear & angular deviations
+kernel -> "numpy" (Bot methods on arrays), "scalar" (same arithmetic on plain floats, faster) or "event" (jumps between ETC events)
+early_abort -> Stops rollouts that provably cannot beat the personal best of the member
+aggregate -> Combines the scores over a bank of paths: "mean", "min" (worst case) or a quantile (0 to 1)
+
+spacing -> Paths are resampled with waypoints this far apart along the path (None: as generated, ~8 to 15 usable, 25 at most)
+num_points -> Paths are resampled to this many evenly spaced waypoints instead (None: as generated)
+spline -> Resampled paths follow a Catmull-Rom spline through the generated waypoints
+samples_per_segment -> Points sampled per segment of the spline before resampling
+
+max_size -> Max number of scores kept in the fitness cache
+resolution -> Step for quantizing design variables in the fitness cache (None: exact keys, opt in with care)
 
 num_bots -> Number of particles in PSO
 learning_rate -> Cognitive & Social Learning Rates
 num_steps -> Number of max iterations for PSO training
+num_paths -> Number of random paths every member is scored on (scores combined by aggregate)
+eval_mode -> "serial" (one member at a time) or "batch" (whole swarm vectorised, faster than the scalar kernel from ~100 bots)
+executor -> None (evaluate in this process) or "process" (spread over a process pool)
+num_workers -> Size of the process pool (all cores if None)
+seed -> Seed for the random streams of the PSO swarm & members (None for a random run)
+update_mode -> "sync" (whole swarm evaluated, then moved) or "async" (every member moves as soon as it is evaluated)
+num_islands -> Number of swarms of num_bots members, each in its own process (island model if > 1)
+migration_every -> Iterations between exchanges of the best members of the islands
+num_migrants -> Number of best members every island sends to its neighbours
+topology -> Islands receiving the migrants: "ring" (next island), "all" or a list of receivers per island
+history_step -> Only every Nth iteration of the particle history is kept (downsampling for long runs)
+checkpoint_every -> The whole swarm is checkpointed every N iterations (0: never)
+patience -> Training stops if the best score has not improved for N iterations (0: never)
+spread_tol -> Training stops if the spread of the swarm (max std of a variable / range_var) falls below it
+time_budget -> Training stops after this many seconds (None: no limit)
+eval_budget -> Training stops after this many evaluations, num_bots per iteration (None: no limit)
+restart_patience -> Members not improving their personal best for N evaluations are re-randomized around init_guess (0: never)
+profile -> Times the phases of every rollout & counts why they ended, saved per iteration to PROFILE.json
+surrogate -> Pre-screens the swarm with an RBF surrogate so that only the selected members are simulated (sync, single swarm)
+fidelity_schedule -> Levels of coarser simulation trained with before full fidelity (sync, single swarm), each a dict of:
+                     dt_scale (coarser dt, same simulated time), horizon (fraction of that time & of the path), path_stride (every Nth waypoint),
+                     iterations & spread (the level ends after this many iterations or once the spread of the swarm falls below it)
+
+max_points -> Most recent scored design variables the surrogate is fitted on
+length_scale -> Length scale of the RBF kernel in units of range_var (None: median distance between the points)
+noise -> Added to the diagonal of the kernel matrix
+screen_fraction -> Fraction of the members simulated for real once the surrogate is in use
+kappa -> Weight of the predicted uncertainty when ranking the members (mean + kappa*std)
+min_points -> Scored design variables needed before the surrogate starts screening
+
+num_paths -> Number of random paths the trained controller & its TTC baseline are compared on (0: no evaluation)
+chunk_size -> Number of paths simulated at once by the batch simulator
+executor -> None (evaluate in this process) or "process" (chunks spread over a process pool)
+num_workers -> Size of the process pool (all cores if None)
+seed -> Seed for drawing the evaluation paths (None for random paths)
+confidence -> Level of the confidence intervals of the reported means
 
 '''
 
@@ -33,7 +86,10 @@ etc_pso_params = {"dt": 0.01,
                   "Q_err": np.diag([0.01, 50.]),
                   "Q_ETC": np.diag([0.01, 5.]),
                   "init_guess": np.array([10., -50., 1., 10., 1., 25., 300.]),
-                  "range_var": np.array([50., 50., 25., 25., 25., 25., 250.])
+                  "range_var": np.array([50., 50., 25., 25., 25., 25., 250.]),
+                  "kernel": "scalar",
+                  "early_abort": False,
+                  "aggregate": "mean"
                   }
 
 
@@ -41,26 +97,79 @@ game_params = {"x_screen": x_screen,
               "y_screen": y_screen,
               "bot_radius": (x_screen + y_screen)//70,
               "Q": etc_pso_params["Q_ETC"],
-              "dt": etc_pso_params["dt"]
+              "dt": etc_pso_params["dt"],
+              "Q_err": etc_pso_params["Q_err"],
+              "max_iter": etc_pso_params["max_iter"],
+              "headless": False,
+              "render": True,
+              "frame_step": 0,
+              "frame_folder": None,
+              "dirty_rects": True
               }
 
 
+path_params = {"spacing": None,
+               "num_points": None,
+               "spline": False,
+               "samples_per_segment": 16}
+
+
+cache_params = {"max_size": 4096,
+                "resolution": None}
+
+
 pso_params = {"num_bots": 50,
               "num_steps": 50,
-              "learning_rate": np.array([0.05, 0.1])}
+              "learning_rate": np.array([0.05, 0.1]),
+              "num_paths": 1,
+              "eval_mode": "serial",
+              "executor": None,
+              "num_workers": None,
+              "seed": None,
+              "update_mode": "sync",
+              "num_islands": 1,
+              "migration_every": 5,
+              "num_migrants": 2,
+              "topology": "ring",
+              "history_step": 1,
+              "checkpoint_every": 5,
+              "patience": 0,
+              "spread_tol": 0.,
+              "time_budget": None,
+              "eval_budget": None,
+              "restart_patience": 0,
+              "profile": False,
+              "surrogate": False,
+              "fidelity_schedule": []}
+
+
+surrogate_params = {"max_points": 500,
+                    "length_scale": None,
+                    "noise": 1e-6,
+                    "screen_fraction": 0.5,
+                    "kappa": 1.,
+                    "min_points": 100}
+
+
+eval_params = {"num_paths": 0,
+               "chunk_size": 100,
+               "executor": None,
+               "num_workers": None,
+               "seed": None,
+               "confidence": 0.95}
 
 
 ############################################################################################
 ############################################################################################
 
 
-def get_coord(octaves=5, seed=5):
+def get_coord(octaves=5, seed=5, density=None):
     '''
     For generating closely related yet
     random coordinates using Perlin Noise
     
     '''
-    density= octaves*100
+    density = octaves*100 if density is None else density
     noise = PerlinNoise(octaves=octaves, seed=seed)
     coords = np.array([noise(i/density) for i in range(density)])
     coords += np.abs(np.min(coords))
@@ -68,16 +177,21 @@ def get_coord(octaves=5, seed=5):
     return coords
 
 
-def get_path(x_screen=x_screen, y_screen=y_screen, octaves=5, seeds=[3, 17], random_flag=1):
+def get_path(x_screen=x_screen, y_screen=y_screen, octaves=5, seeds=[3, 17], random_flag=1, bank=None):
     '''
     For generating paths using coordinates
-    obtained from get_coord function
+    obtained from get_coord function; with
+    a PathBank the path is read from disk
+    (and stored there if missing)
     
     '''
     if random_flag:
         octaves = np.random.randint(3, 5)
         seeds = np.random.random((1, 2))[0]*1000
     
+    if bank is not None:
+        return bank.get(octaves, seeds, x_screen, y_screen)
+    
     x_coord = get_coord(octaves=octaves, seed=seeds[0])*x_screen
     y_coord = get_coord(octaves=octaves, seed=seeds[1])*y_screen
     path = np.dstack((x_coord, y_coord))[0]
@@ -123,9 +237,18 @@ def plot_vlines(ax, instants):
 
 
 class animate():
+    '''
+    Animation of the evolution of the weights;
+    one line per particle is created in load and
+    every frame only changes the data of the
+    lines, so the frames can be blitted and no
+    artists pile up as the animation goes on
+    
+    '''
+    
     def __init__(self, ax, x_label, y_label, title, data, global_best, init_guess):
-        self.load(ax, x_label, y_label, title, data, global_best, init_guess)
         self.line_style_arr = ["solid", "dashed", "dotted", "dashdot"]
+        self.load(ax, x_label, y_label, title, data, global_best, init_guess)
         
     def load(self, ax, x_label, y_label, title, data, global_best, init_guess):
         self.ax = ax
@@ -140,25 +263,38 @@ class animate():
         self.oneD = True
         if self.data.shape[-1] == 2:
             self.oneD = False
-    
-    
-    def update(self, frame):
-        line_style_index = 0
+        
+        self.lines = []
         for index in range(self.num_lines):
-            curr_pt = self.data[index, :frame]
-            if self.oneD:
-                self.ax.plot(curr_pt, linestyle=self.line_style_arr[line_style_index])
-            elif not self.oneD:
-                self.ax.plot(curr_pt[:, 0], curr_pt[:, 1], linestyle=self.line_style_arr[line_style_index])
-            line_style_index = (line_style_index + 1)%len(self.line_style_arr)
+            line_style = self.line_style_arr[index%len(self.line_style_arr)]
+            self.lines.append(ax.plot([], [], linestyle=line_style)[0])
         
+        # Limits are fixed from the whole history, as the axes are not redrawn while blitting
         if self.oneD:
-            self.ax.axhline(y=self.g_best, alpha=0.5, color="green", linestyle="dashed")
-            self.ax.axhline(y=self.init_guess, alpha=0.5, color="red", linestyle="dashed")
+            ax.axhline(y=self.g_best, alpha=0.5, color="green", linestyle="dashed")
+            ax.axhline(y=self.init_guess, alpha=0.5, color="red", linestyle="dashed")
+            ax.update_datalim([(0, np.min(self.data)), (self.data.shape[1]-1, np.max(self.data))])
         
         elif not self.oneD:
-            self.ax.scatter(self.g_best[0], self.g_best[1], color="green")
-            self.ax.scatter(self.init_guess[0], self.init_guess[1], color="red")
+            ax.scatter(self.g_best[0], self.g_best[1], color="green")
+            ax.scatter(self.init_guess[0], self.init_guess[1], color="red")
+            ax.update_datalim(self.data.reshape(-1, 2))
+        ax.autoscale_view()
+    
+    
+    def init(self):
+        for line in self.lines:
+            line.set_data([], [])
+        return self.lines
+    
+    
+    def update(self, frame):
+        for line, curr_pt in zip(self.lines, self.data[:, :frame]):
+            if self.oneD:
+                line.set_data(np.arange(curr_pt.shape[0]), curr_pt)
+            elif not self.oneD:
+                line.set_data(curr_pt[:, 0], curr_pt[:, 1])
+        return self.lines
         
     
 ############################################################################################
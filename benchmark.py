@@ -0,0 +1,60 @@
+import sys
+import argparse
+import tempfile
+
+from SOURCE.benchmarks import animation_benchmark, update_mode_benchmark, surrogate_benchmark, fidelity_benchmark, run_suite, save_results, compare
+
+
+if __name__ == "__main__":
+    '''
+    BENCHMARKS:
+    animation -> GIF generation time of the weight
+                 evolution animations against
+                 num_steps and num_bots
+    update_mode -> Wall-clock convergence of the sync
+                   and async PSO update modes on the
+                   same budget
+    surrogate -> Real evaluations saved by the surrogate
+                 pre-screening for the same final score
+    fidelity -> Training time & final score with a
+                coarse-to-fine fidelity schedule
+    suite -> Timings of the simulation & optimization
+             hot paths, saved as JSON (--output)
+    compare -> Flags the benchmarks of a results file
+               worse than a baseline file by more
+               than --tolerance (exits with 1 if any)
+    
+    '''
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=["animation", "update_mode", "surrogate", "fidelity", "suite", "compare"])
+    parser.add_argument("files", nargs="*", help="compare: baseline.json results.json")
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    
+    if args.benchmark == "animation":
+        with tempfile.TemporaryDirectory() as folder:
+            animation_benchmark(folder)
+    
+    elif args.benchmark == "update_mode":
+        update_mode_benchmark(num_workers=args.num_workers)
+    
+    elif args.benchmark == "surrogate":
+        surrogate_benchmark()
+    
+    elif args.benchmark == "fidelity":
+        fidelity_benchmark()
+    
+    elif args.benchmark == "suite":
+        with tempfile.TemporaryDirectory() as folder:
+            save_results(run_suite(folder, repeats=args.repeats), args.output)
+    
+    elif args.benchmark == "compare":
+        if len(args.files) != 2: parser.error("compare needs baseline.json results.json")
+        regressions = compare(*args.files, tolerance=args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -1,15 +1,20 @@
 import os
 import numpy as np
-from sys import path
+from sys import path, argv
 from datetime import datetime    
 
 from SOURCE.main import *
 
 
 if __name__ == "__main__": 
-    file_path = os.path.join(path[0], "OUTPUTS", datetime.now().strftime(rf"%d_%m_%Y %H_%M_%S"))
+    # Passing the folder of an earlier run resumes its training from the last checkpoint
+    resume = len(argv) > 1
+    if resume:
+        file_path = os.path.abspath(argv[1])
+    else:
+        file_path = os.path.join(path[0], "OUTPUTS", datetime.now().strftime(rf"%d_%m_%Y %H_%M_%S"))
+        os.mkdir(file_path)
     print(f"\nCheck {file_path} for output plots...")
-    os.mkdir(file_path)
     
     '''
     CHANGE THE PARAMS IF NEEDED BY
@@ -34,16 +39,68 @@ if __name__ == "__main__":
     # etc_pso_params["Q_ETC"] = np.diag([0.01, 5.])     # diff_input.T @ Q_ETC @ diff_input: Weights for determining ETC triggers
     # etc_pso_params["init_guess"] = np.array([10., -50., 1., 10., 1., 25., 300.])      # Initial Guess for PSO
     # etc_pso_params["range_var"] = np.array([50., 50., 25., 25., 25., 25., 250.])      # Range of variables randomly chosen around init_guess
+    # etc_pso_params["kernel"] = "scalar"               # "numpy": Bot methods on arrays, "scalar": same arithmetic on plain floats, "event": jumps between ETC events
+    # etc_pso_params["early_abort"] = False             # Stops rollouts that provably cannot beat the personal best
+    # etc_pso_params["aggregate"] = "mean"              # Combines scores over a bank of paths: "mean", "min" or a quantile (0 to 1)
 
     # game_params["x_screen"] = x_screen
     # game_params["y_screen"] = y_screen
     # game_params["bot_radius"] = (x_screen + y_screen)//70
     # game_params["Q"] = etc_pso_params["Q_ETC"]
     # game_params["dt"] = etc_pso_params["dt"]
+    # game_params["Q_err"] = etc_pso_params["Q_err"]       # Headless simulations end once the error exceeds 1e2 under Q_err
+    # game_params["max_iter"] = etc_pso_params["max_iter"] # ... or after this many steps
+    # game_params["headless"] = False     # Offscreen simulation (SDL dummy driver) without frame cap
+    # game_params["render"] = True        # False skips drawing the simulation entirely
+    # game_params["frame_step"] = 0       # Saves every Nth frame as a png (0 saves none)
+    # game_params["frame_folder"] = None  # Folder for saved frames (FRAMES in the output folder if None)
+    # game_params["dirty_rects"] = True   # Redraws only the areas around the bot & the waypoint marker
+
+    # path_params["spacing"] = None         # Resamples paths with waypoints this far apart along the path (None: as generated, ~8 to 15 usable)
+    # path_params["num_points"] = None      # Resamples paths to this many evenly spaced waypoints instead
+    # path_params["spline"] = False         # Resampled paths follow a Catmull-Rom spline through the generated waypoints
+    # path_params["samples_per_segment"] = 16   # Points sampled per spline segment before resampling
+
+    # cache_params["max_size"] = 4096      # Max number of scores kept in the fitness cache
+    # cache_params["resolution"] = None    # Step for quantizing design variables in the fitness cache (None: exact)
 
     # pso_params["num_bots"] = 50       # Number of particles in PSO
     # pso_params["num_steps"] = 50      # Number of max iterations for PSO training
     # pso_params["learning_rate"] = np.array([0.05, 0.1])       # Cognitive & Social Learning Rates
+    # pso_params["num_paths"] = 1         # Number of random paths every member is scored on
+    # pso_params["eval_mode"] = "serial"    # "serial": one member at a time, "batch": whole swarm vectorised (wins from ~100 bots)
+    # pso_params["executor"] = None         # None: evaluate in this process, "process": spread over a process pool
+    # pso_params["num_workers"] = None      # Size of the process pool (all cores if None)
+    # pso_params["seed"] = None             # Seed for the random streams of the PSO members
+    # pso_params["update_mode"] = "sync"    # "sync": whole swarm evaluated then moved, "async": members move as soon as they are evaluated
+    # pso_params["num_islands"] = 1         # Number of swarms of num_bots members in separate processes (island model if > 1)
+    # pso_params["migration_every"] = 5     # Iterations between migrations of the best members of the islands
+    # pso_params["num_migrants"] = 2        # Number of best members every island sends to its neighbours
+    # pso_params["topology"] = "ring"       # Receivers of the migrants: "ring", "all" or a list of receivers per island
+    # pso_params["history_step"] = 1        # Keeps every Nth iteration of the particle history (downsampling)
+    # pso_params["checkpoint_every"] = 5    # Checkpoints the swarm every N iterations (0: never)
+    # pso_params["patience"] = 0            # Stops if the best score has not improved for N iterations (0: never)
+    # pso_params["spread_tol"] = 0.         # Stops if the swarm spread (max std of a variable / range_var) falls below it
+    # pso_params["time_budget"] = None      # Stops after this many seconds of training
+    # pso_params["eval_budget"] = None      # Stops after this many evaluations (num_bots per iteration)
+    # pso_params["restart_patience"] = 0    # Re-randomizes members around init_guess after N evaluations without improvement (0: never)
+    # pso_params["profile"] = False         # Times the rollout phases & termination reasons, saved to PROFILE.json
+    # pso_params["surrogate"] = False       # Pre-screens the swarm with an RBF surrogate, only selected members are simulated
+    # pso_params["fidelity_schedule"] = []  # Coarse-to-fine levels, e.g. [{"horizon": 0.25, "iterations": 10}, {"horizon": 0.5, "spread": 0.1}]
+
+    # surrogate_params["max_points"] = 500      # Most recent scored design variables the surrogate is fitted on
+    # surrogate_params["length_scale"] = None   # RBF length scale in units of range_var (None: median distance)
+    # surrogate_params["noise"] = 1e-6          # Added to the diagonal of the kernel matrix
+    # surrogate_params["screen_fraction"] = 0.5 # Fraction of the members simulated for real
+    # surrogate_params["kappa"] = 1.            # Weight of the uncertainty in the ranking (mean + kappa*std)
+    # surrogate_params["min_points"] = 100      # Scored design variables needed before screening starts
+
+    # eval_params["num_paths"] = 0          # Paths the trained controller & its TTC baseline are compared on (0: no evaluation)
+    # eval_params["chunk_size"] = 100       # Paths simulated at once by the batch simulator
+    # eval_params["executor"] = None        # None: evaluate in this process, "process": spread over a process pool
+    # eval_params["num_workers"] = None     # Size of the process pool (all cores if None)
+    # eval_params["seed"] = None            # Seed for drawing the evaluation paths
+    # eval_params["confidence"] = 0.95      # Level of the confidence intervals
     
     
     '''
@@ -53,4 +110,4 @@ if __name__ == "__main__":
     
     '''
     
-    RUN(file_path)
\ No newline at end of file
+    RUN(file_path, resume)
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SOURCE.utilities import etc_pso_params, pso_params, cache_params, get_path
+from SOURCE.pso_algo import PSO
+from SOURCE.history_sink import HistorySink
+from SOURCE.fitness_cache import FitnessCache
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+A run that crashes after a checkpoint and is
+resumed from it must end exactly like the same
+run done without interruption, cache & restarts
+included
+
+'''
+
+NUM_BOTS = 10
+NUM_ITER = 9
+TRAIN_PARAMS = {"restart_patience": 3, "verbose": False}
+
+
+@pytest.fixture(scope="module")
+def path():
+    return get_path(random_flag=0)
+
+
+def new_pso(path):
+    params = dict(etc_pso_params, path=path, cache=FitnessCache(**cache_params))
+    return PSO(NUM_BOTS, seed=0, **params)
+
+
+def test_resume_matches_uninterrupted(path, tmp_path):
+    expected = new_pso(path).train(NUM_ITER, pso_params["learning_rate"], **TRAIN_PARAMS)
+    
+    pso = new_pso(path)
+    update_vars = pso.update_vars
+    def crash():
+        if pso.iteration == 7:
+            raise RuntimeError("crash")
+        update_vars()
+    pso.update_vars = crash
+    
+    checkpoint_file = os.path.join(tmp_path, "CHECKPOINT.pkl")
+    with pytest.raises(RuntimeError):
+        pso.train(NUM_ITER, pso_params["learning_rate"], HistorySink(NUM_ITER, NUM_BOTS),
+                  checkpoint_file=checkpoint_file, checkpoint_every=3, **TRAIN_PARAMS)
+    
+    pso, history = PSO.load_checkpoint(checkpoint_file)
+    assert pso.iteration == 6
+    output = pso.train(NUM_ITER, pso_params["learning_rate"], history, **TRAIN_PARAMS)
+    
+    for key in ("vars_history", "scores_history", "best_scores_history", "max_score", "P", "I", "D", "thresh"):
+        assert np.array_equal(output[key], expected[key]), key
+    assert output["num_restarts"] == expected["num_restarts"]
+    assert output["cache_stats"] == expected["cache_stats"]
+
+
+############################################################################################
+############################################################################################
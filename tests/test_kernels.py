@@ -0,0 +1,66 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SOURCE.utilities import etc_pso_params, get_path
+from SOURCE.bot_sim import ETC_PSO_Member, ETC_PSO_Batch
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Scores of a fixed path and a handful of seeded
+design vectors: the numpy, scalar and batch
+kernels must agree bit for bit, the event
+kernel within 1e-6
+
+'''
+
+@pytest.fixture(scope="module")
+def sys_params():
+    params = dict(etc_pso_params)
+    params["path"] = get_path(random_flag=0)
+    return params
+
+
+@pytest.fixture(scope="module")
+def vectors(sys_params):
+    rng = np.random.default_rng(0)
+    return sys_params["init_guess"] + (rng.random((8, 7)) - 0.5)*sys_params["range_var"]
+
+
+def member_scores(sys_params, vectors, kernel):
+    member = ETC_PSO_Member(**dict(sys_params, kernel=kernel))
+    scores = []
+    for vars in vectors:
+        member.vars = vars
+        scores.append(member.eval())
+    return np.array(scores)
+
+
+@pytest.fixture(scope="module")
+def numpy_scores(sys_params, vectors):
+    return member_scores(sys_params, vectors, "numpy")
+
+
+def test_scalar_matches_numpy(sys_params, vectors, numpy_scores):
+    assert np.array_equal(member_scores(sys_params, vectors, "scalar"), numpy_scores)
+
+
+def test_batch_matches_numpy(sys_params, vectors, numpy_scores):
+    batch = ETC_PSO_Batch(**sys_params)
+    assert np.array_equal(batch.eval(vectors), numpy_scores)
+
+
+def test_event_within_tolerance(sys_params, vectors, numpy_scores):
+    scores = member_scores(sys_params, vectors, "event")
+    assert np.allclose(scores, numpy_scores, rtol=0., atol=1e-6)
+
+
+############################################################################################
+############################################################################################
@@ -0,0 +1,51 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SOURCE.utilities import etc_pso_params, pso_params, get_path
+from SOURCE.pso_algo import PSO
+
+
+############################################################################################
+############################################################################################
+
+
+'''
+Seeded runs give the same history whether the
+swarm is simulated member by member, as a batch
+or over a process pool, with & without early abort
+
+'''
+
+NUM_BOTS = 8
+NUM_ITER = 4
+
+
+@pytest.fixture(scope="module")
+def path():
+    return get_path(random_flag=0)
+
+
+def history(path, early_abort, **pso_kwargs):
+    params = dict(etc_pso_params, path=path, early_abort=early_abort)
+    output = PSO(NUM_BOTS, seed=0, **pso_kwargs, **params).train(NUM_ITER, pso_params["learning_rate"], verbose=False)
+    return output["vars_history"], output["best_scores_history"]
+
+
+@pytest.mark.parametrize("early_abort", [False, True])
+@pytest.mark.parametrize("pso_kwargs", [{"eval_mode": "batch"},
+                                        {"executor": "process", "num_workers": 2},
+                                        {"eval_mode": "batch", "executor": "process", "num_workers": 2}],
+                         ids=["batch", "process", "batch-process"])
+def test_matches_serial(path, early_abort, pso_kwargs):
+    vars_history, best_scores_history = history(path, early_abort, eval_mode="serial")
+    curr_vars_history, curr_best_scores_history = history(path, early_abort, **pso_kwargs)
+    assert np.array_equal(curr_vars_history, vars_history)
+    assert np.array_equal(curr_best_scores_history, best_scores_history)
+
+
+############################################################################################
+############################################################################################